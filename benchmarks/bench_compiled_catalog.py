@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 UuuNyaa <UuuNyaa@gmail.com>
+# This file is part of blender_addon_m17n_tools.
+
+# blender_addon_m17n_tools is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# blender_addon_m17n_tools is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare the import + register() time of the generated module between --format python and --format compiled."""
+
+import argparse
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from types import ModuleType
+from typing import Dict, List, Union
+
+TOOL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'blender_addon_m17n_tools.py')
+
+# stands in for Blender's bpy, only what the generated modules call
+FAKE_BPY = '''class _Translations:
+    def register(self, name, translation_dict):
+        pass
+
+    def unregister(self, name):
+        pass
+
+    def pgettext_iface(self, msgid):
+        return msgid
+
+
+class app:
+    translations = _Translations()
+'''
+
+IMPORT_SCRIPT = '''import sys, time
+start = time.perf_counter()
+import {module}
+{module}.register()
+print(time.perf_counter() - start)
+'''
+
+
+def load_tool() -> ModuleType:
+    loader = importlib.machinery.SourceFileLoader('blender_addon_m17n_tools', TOOL_PATH)
+    tool = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(tool)
+    return tool
+
+
+def write_outputs(tool: ModuleType, directory: str, msgid_count: int, locale_count: int):
+    msgid_message = {}
+    for i in range(msgid_count):
+        msgid = f'Message number {i} of the synthetic add-on'
+        msgid_message[msgid] = tool.Message(msgid, [(f'addon/module{i % 100}.py', i)], False)
+
+    locales = ['en_US'] + [f'xx_{i:02d}' for i in range(1, locale_count)]
+    locale_msgid_context_msgstr = {
+        locale: {msgid: {'*': f'[{locale}] {msgid}'} for msgid in msgid_message}
+        for locale in locales
+    }
+
+    lines: List[str] = []
+    tool.append_header(lines, False)
+    tool.append_translation_dict(lines, msgid_message, locale_msgid_context_msgstr, '*', 'en_US')
+    tool.append_footer(lines)
+    with open(os.path.join(directory, 'm17n_python.py'), 'w') as file:
+        file.write(''.join(f'{line}\n' for line in lines))
+
+    lines = []
+    tool.append_catalog_loader(lines, 'm17n_compiled.catalog', False)
+    with open(os.path.join(directory, 'm17n_compiled.py'), 'w') as file:
+        file.write(''.join(f'{line}\n' for line in lines))
+    with open(os.path.join(directory, 'm17n_compiled.catalog'), 'wb') as file:
+        file.write(tool.encode_catalog(tool.build_translation_dict(msgid_message, locale_msgid_context_msgstr, '*', 'en_US')))
+
+    os.makedirs(os.path.join(directory, 'bpy'))
+    with open(os.path.join(directory, 'bpy', '__init__.py'), 'w') as file:
+        file.write(FAKE_BPY)
+
+
+def measure(directory: str, module: str, repeat: int, cold: bool) -> float:
+    """Return the best time of importing the module and calling register() in a fresh interpreter."""
+    best = float('inf')
+    for _ in range(repeat):
+        if cold:
+            shutil.rmtree(os.path.join(directory, '__pycache__'), ignore_errors=True)
+        result = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(module=module)], cwd=directory, capture_output=True, text=True, check=True)
+        best = min(best, float(result.stdout))
+    return best
+
+
+def main(args: Union[List[str], None] = None):
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--msgid_count', type=int, default=5000, help='number of msgids')
+    parser.add_argument('--locale_count', type=int, default=10, help='number of locales including the default locale')
+    parser.add_argument('--repeat', type=int, default=5, help='number of imports to take the best time of')
+    options = parser.parse_args(sys.argv[1:] if args is None else args)
+
+    tool = load_tool()
+    with tempfile.TemporaryDirectory() as directory:
+        write_outputs(tool, directory, options.msgid_count, options.locale_count)
+
+        sizes: Dict[str, int] = {
+            'python': os.path.getsize(os.path.join(directory, 'm17n_python.py')),
+            'compiled': os.path.getsize(os.path.join(directory, 'm17n_compiled.py')) + os.path.getsize(os.path.join(directory, 'm17n_compiled.catalog')),
+        }
+
+        print(f'{options.msgid_count} msgids x {options.locale_count} locales')
+        print(f'{"format":<10} {"size":>12} {"cold import":>12} {"warm import":>12}')
+        for output_format in ('python', 'compiled'):
+            module = f'm17n_{output_format}'
+            cold = measure(directory, module, options.repeat, True)
+            warm = measure(directory, module, options.repeat, False)
+            print(f'{output_format:<10} {sizes[output_format]:>12,} {cold * 1000:>10.1f}ms {warm * 1000:>10.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 UuuNyaa <UuuNyaa@gmail.com>
+# This file is part of blender_addon_m17n_tools.
+
+# blender_addon_m17n_tools is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# blender_addon_m17n_tools is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Time every stage of the tool on a synthetic add-on and report files/sec, msgids/sec and peak memory.
+
+Save the results with --json and pass them to --compare on a later run to catch the regressions.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Union
+
+import synthetic_addon
+
+
+class Stages:
+    """Inputs of every stage, each stage is prepared by the previous ones outside of the timing."""
+
+    def __init__(self, tool: ModuleType, directory: str, distance_ratio_threshold: float):
+        self.tool = tool
+        self.distance_ratio_threshold = distance_ratio_threshold
+        self.addon_directory = os.path.join(directory, 'addon')
+        self.output_python_file_path = os.path.join(directory, 'm17n.py')
+
+        self.potext = tool.get_potext([self.addon_directory], '_ iface_')
+        self.msgid_message = tool.extract_messages([self.addon_directory], '_ iface_')
+        self.translations = tool.read_translations(self.output_python_file_path, 'en_US')
+
+    def get_potext(self):
+        self.tool.get_potext([self.addon_directory], '_ iface_')
+
+    def parse_potext(self):
+        self.tool.parse_potext(self.potext)
+
+    def read_translations(self):
+        self.tool.read_translations(self.output_python_file_path, 'en_US')
+
+    def append_translation_dict(self):
+        self.tool.append_translation_dict([], self.msgid_message, self.translations, '*', 'en_US')
+
+    def analyze(self):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            self.tool.analyze([self.addon_directory], '_ iface_', self.distance_ratio_threshold)
+
+
+STAGE_NAMES = ['get_potext', 'parse_potext', 'read_translations', 'append_translation_dict', 'analyze']
+
+
+def measure(stage: Callable[[], None], repeat: int) -> Dict[str, float]:
+    """Return the best wall time of the repeats and the peak of the traced memory of one more run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        best = min(best, time.perf_counter() - start)
+
+    # tracemalloc slows down the allocations, so the peak is taken separately from the timings
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def main(args: Union[List[str], None] = None):
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    synthetic_addon.add_arguments(parser)
+    parser.add_argument('--stages', type=str, nargs='+', default=STAGE_NAMES, choices=STAGE_NAMES, help='stages to measure')
+    # the synthetic msgids are made of a few syllables, so they are more similar to each other than real ones
+    parser.add_argument('--distance_ratio_threshold', type=float, default=0.2, help='threshold of the analyze stage')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs to take the best time of')
+    parser.add_argument('--json', type=str, default=None, help='path to save the results')
+    parser.add_argument('--compare', type=str, default=None, help='path of the results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='ratio of the slowdown reported as a regression')
+    options = parser.parse_args(sys.argv[1:] if args is None else args)
+
+    tool = synthetic_addon.load_tool()
+    results: Dict[str, Any] = {'parameters': {key: value for key, value in vars(options).items() if key not in ('stages', 'repeat', 'json', 'compare', 'tolerance')}, 'stages': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        msgids = synthetic_addon.write_addon(directory, options.file_count, options.msgids_per_file, options.msgid_length, options.fstring_ratio, options.seed)
+        synthetic_addon.write_translations(tool, os.path.join(directory, 'm17n.py'), msgids, options.locale_count)
+        stages = Stages(tool, directory, options.distance_ratio_threshold)
+
+        print(f'{options.file_count} files, {len(msgids)} msgids, {options.locale_count} locales')
+        print(f'{"stage":<24} {"time":>10} {"files/sec":>12} {"msgids/sec":>12} {"peak memory":>12}')
+        for stage_name in options.stages:
+            result = measure(getattr(stages, stage_name), options.repeat)
+            results['stages'][stage_name] = result
+            print(f'{stage_name:<24} {result["seconds"] * 1000:>8.1f}ms {options.file_count / result["seconds"]:>12,.0f} {len(msgids) / result["seconds"]:>12,.0f} {result["peak_bytes"] / 1024 / 1024:>10.1f}MB')
+
+    if options.json:
+        with open(options.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if options.compare:
+        with open(options.compare, 'r') as file:
+            previous_results = json.load(file)
+
+        if previous_results['parameters'] != results['parameters']:
+            print(f'the parameters differ from {options.compare}, the comparison may be meaningless', file=sys.stderr)
+
+        regressions = []
+        for stage_name, result in results['stages'].items():
+            previous_result = previous_results['stages'].get(stage_name)
+            if previous_result is None:
+                continue
+            ratio = result['seconds'] / previous_result['seconds']
+            memory_ratio = result['peak_bytes'] / max(1, previous_result['peak_bytes'])
+            print(f'{stage_name:<24} time x{ratio:.2f}, peak memory x{memory_ratio:.2f}')
+            if ratio > 1 + options.tolerance or memory_ratio > 1 + options.tolerance:
+                regressions.append(stage_name)
+
+        if regressions:
+            print(f'regressions: {" ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
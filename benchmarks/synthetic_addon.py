@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Copyright 2021 UuuNyaa <UuuNyaa@gmail.com>
+# This file is part of blender_addon_m17n_tools.
+
+# blender_addon_m17n_tools is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# blender_addon_m17n_tools is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTIBILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Generate a synthetic add-on tree and its translations for the benchmarks.
+
+The output only depends on the arguments and the seed, so the numbers of different runs are comparable.
+"""
+
+import argparse
+import importlib.machinery
+import importlib.util
+import os
+import random
+import sys
+from types import ModuleType
+from typing import Dict, List, Union
+
+TOOL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'blender_addon_m17n_tools.py')
+
+SYLLABLES = [
+    'ar', 'ba', 'be', 'ca', 'co', 'de', 'di', 'ed', 'en', 'fa', 'ge', 'in', 'is', 'ka', 'la',
+    'li', 'ma', 'me', 'mo', 'na', 'ne', 'no', 'or', 'pa', 'po', 'ra', 're', 'ri', 'ro', 'sa',
+    'se', 'si', 'so', 'ta', 'te', 'ti', 'to', 'tu', 'un', 've', 'vi', 'xe', 'ya', 'ze', 'zu',
+]
+
+
+def load_tool() -> ModuleType:
+    loader = importlib.machinery.SourceFileLoader('blender_addon_m17n_tools', TOOL_PATH)
+    tool = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(tool)
+    return tool
+
+
+def new_words(rng: random.Random, word_count: int) -> List[str]:
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))) for _ in range(word_count)]
+
+
+def new_msgid(rng: random.Random, words: List[str], msgid_length: int) -> str:
+    msgid_words: List[str] = []
+    while sum(len(word) + 1 for word in msgid_words) < msgid_length:
+        msgid_words.append(rng.choice(words))
+    return ' '.join(msgid_words).capitalize()
+
+
+def write_addon(directory: str, file_count: int, msgids_per_file: int, msgid_length: int, fstring_ratio: float, seed: int = 0) -> List[str]:
+    """Write file_count modules into directory/addon and return all msgids in the order of their first appearance.
+
+    A module has a panel class and msgids_per_file calls of _() or iface_(), a part of them in f-strings.
+    Some msgids are shared between the modules, like the common labels of a real add-on.
+    """
+    rng = random.Random(seed)
+    words = new_words(rng, 2000)
+    shared_msgids = [new_msgid(rng, words, msgid_length) for _ in range(max(1, msgids_per_file // 4))]
+
+    msgids: Dict[str, None] = {}
+    addon_directory = os.path.join(directory, 'addon')
+    for file_index in range(file_count):
+        module_directory = os.path.join(addon_directory, f'package{file_index // 50}')
+        os.makedirs(module_directory, exist_ok=True)
+
+        label = new_msgid(rng, words, msgid_length)
+        msgids.setdefault(label)
+
+        lines = [
+            'import bpy',
+            'from ..m17n import _, iface_',
+            '',
+            '',
+            f'class VIEW3D_PT_panel{file_index}(bpy.types.Panel):',
+            f'    bl_idname = "VIEW3D_PT_panel{file_index}"',
+            f'    bl_label = _({label!r})',
+            '',
+            '    def draw(self, context):',
+            '        layout = self.layout',
+            '        count = len(context.selected_objects)',
+        ]
+        for _ in range(msgids_per_file):
+            msgid = rng.choice(shared_msgids) if rng.random() < 0.2 else new_msgid(rng, words, msgid_length)
+            msgids.setdefault(msgid)
+            if rng.random() < fstring_ratio:
+                lines.append(f'        layout.label(text=f"{{_({msgid!r})}}: {{count}}")')
+            elif rng.random() < 0.5:
+                lines.append(f'        layout.label(text=iface_({msgid!r}))')
+            else:
+                lines.append(f'        layout.operator("object.select_all", text=_({msgid!r}))')
+
+        with open(os.path.join(module_directory, f'module{file_index}.py'), 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    return list(msgids)
+
+
+def write_translations(tool: ModuleType, output_python_file_path: str, msgids: List[str], locale_count: int):
+    """Write an m17n.py of the default format in which every locale translates every msgid."""
+    msgid_message = {msgid: tool.Message(msgid, [('addon/module.py', i)], False) for i, msgid in enumerate(msgids)}
+    locales = ['en_US'] + [f'xx_{i:02d}' for i in range(1, locale_count)]
+    locale_msgid_context_msgstr = {
+        locale: {msgid: {'*': msgid if locale == 'en_US' else f'[{locale}] {msgid}'} for msgid in msgids}
+        for locale in locales
+    }
+
+    lines: List[str] = []
+    tool.append_header(lines, False)
+    tool.append_translation_dict(lines, msgid_message, locale_msgid_context_msgstr, '*', 'en_US')
+    tool.append_footer(lines)
+    with open(output_python_file_path, 'w') as file:
+        file.write(''.join(f'{line}\n' for line in lines))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--file_count', type=int, default=200, help='number of python files')
+    parser.add_argument('--msgids_per_file', type=int, default=20, help='number of _() and iface_() calls per file')
+    parser.add_argument('--msgid_length', type=int, default=30, help='approximate length of a msgid')
+    parser.add_argument('--fstring_ratio', type=float, default=0.1, help='ratio of the calls in f-strings')
+    parser.add_argument('--locale_count', type=int, default=5, help='number of locales of m17n.py including the default locale')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+
+def main(args: Union[List[str], None] = None):
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('directory', type=str, help='directory to write addon/ and m17n.py into')
+    add_arguments(parser)
+    options = parser.parse_args(sys.argv[1:] if args is None else args)
+
+    msgids = write_addon(options.directory, options.file_count, options.msgids_per_file, options.msgid_length, options.fstring_ratio, options.seed)
+    write_translations(load_tool(), os.path.join(options.directory, 'm17n.py'), msgids, options.locale_count)
+    print(f'{options.file_count} files, {len(msgids)} msgids, {options.locale_count} locales: {options.directory}')
+
+
+if __name__ == '__main__':
+    main()
@@ -17,27 +17,86 @@
 
 
 import argparse
+import array
+import ast
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import ctypes
+import functools
+import hashlib
+import heapq
 import importlib.machinery
 import importlib.util
 import io
+import itertools
+import json
+import mmap
 import os
+import re
+import select
+import shutil
+import socket
+import stat
+import struct
 import sys
+import time
 import tokenize
-from dataclasses import dataclass
+import tracemalloc
+from dataclasses import dataclass, field
 from types import ModuleType
-from typing import Dict, List, Set, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, List, Pattern, Sequence, Set, Tuple, Union
 
 PACKAGE_PATH = os.path.dirname(__file__)
+PYGETTEXT_PATH = os.path.join(PACKAGE_PATH, 'externals', 'pygettext', 'pygettext.py')
+
+I18N_SECTION_BEGIN = '# ##### BEGIN AUTOGENERATED I18N SECTION #####'
+I18N_SECTION_END = '# ##### END AUTOGENERATED I18N SECTION #####'
 
 
 @dataclass
 class PoEntry:
+    __slots__ = ('message', 'comment')
+
     message: str
     comment: str
 
 
+@dataclass
+class Message:
+    # a message per msgid lives as long as the run, without __dict__ it is less than half the size
+    __slots__ = ('msgid', 'locations', 'isdocstring')
+
+    msgid: str
+    locations: List[Tuple[str, int]]
+    isdocstring: bool
+
+    @property
+    def comment(self) -> str:
+        return '#: ' + ' '.join(f'{filename}:{lineno}' for filename, lineno in self.locations)
+
+
 Translations = Dict[str, Dict[str, Dict[str, str]]]
 
+BpyMessageKey = Tuple[str, str]
+BpyTranslations = Dict[BpyMessageKey, str]
+BpyTranslationDict = Dict[str, BpyTranslations]
+TranslationComments = Dict[str, Dict[BpyMessageKey, List[str]]]
+
+SimilarPair = Tuple[int, int, int]
+
+
+def parse_job_count(value: str) -> int:
+    """Parse the value of -j/--jobs, a positive number of processes or 0 for the number of CPUs."""
+    try:
+        jobs = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {value!r}')
+    if jobs < 0:
+        raise argparse.ArgumentTypeError(f'must be a positive number or 0 for the number of CPUs: {value!r}')
+    return jobs
+
 
 def main(args: Union[List[str], None] = None):
     parser = argparse.ArgumentParser()
@@ -48,187 +107,2179 @@ def main(args: Union[List[str], None] = None):
     parser_generate.add_argument('--default_locale', type=str, default='en_US', help='default locale')
     parser_generate.add_argument('--default_context', type=str, default='*', help='default context')
     parser_generate.add_argument('--no_output_utilities', const=True, default=False, action='store_const', help='do not output utility functions')
+    parser_generate.add_argument('--cache_directory', type=str, default=None, help='directory to cache the extracted messages per file (e.g. .m17n_cache)')
+    parser_generate.add_argument('-j', '--jobs', type=parse_job_count, default=1, help='number of processes to extract messages in parallel (0: number of CPUs)')
+    parser_generate.add_argument('--engine', type=str, default='tokenize', choices=['tokenize', 'ast'], help='tokenize: pygettext TokenEater, ast: walk the syntax tree of each file once, falling back to tokenize for the files it cannot handle in the same way')
+    parser_generate.add_argument('--exclude', type=str, action='append', default=[], help='glob in the syntax of .gitignore of the paths to skip, relative to each input directory, in addition to .gitignore and .m17nignore found in them (may be repeated multiple times)')
+    parser_generate.add_argument('--format', type=str, default='python', choices=['python', 'compiled', 'lazy'], help='python: translation_dict in the output file, compiled: a binary catalog next to the output file that is a loader module, lazy: per-locale files that the output loader module loads only for the active locale')
+    parser_generate.add_argument('--fuzzy', const=True, default=False, action='store_const', help='copy the translations of the msgids no longer found in the sources to the most similar untranslated msgids, marked with "#, fuzzy" comments')
+    parser_generate.add_argument('--fuzzy_distance_ratio_threshold', type=float, default=0.3, help='threshold for the ratio of distance / len(msgid) of --fuzzy')
+    parser_generate.add_argument('--profile', const=True, default=False, action='store_const', help='print the wall time, CPU time and peak memory of each phase and the slowest files to stderr (tracing the memory slows down the run)')
+    parser_generate.add_argument('--metrics_json', type=str, default=None, help='path to write the metrics of --profile as JSON')
     parser_generate.add_argument('input_python_file_paths', type=str, nargs='+', help='input python file paths (allow files as well as directories)')
 
+    parser_watch = subpersers.add_parser('watch', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_watch.add_argument('-o', '--output_python_file_path', type=str, required=True, help='path of the output file')
+    parser_watch.add_argument('-k', '--keywords', type=str, default='_ iface_', help='space-separated list of keywords to look for in addition to the defaults (may be repeated multiple times)')
+    parser_watch.add_argument('--default_locale', type=str, default='en_US', help='default locale')
+    parser_watch.add_argument('--default_context', type=str, default='*', help='default context')
+    parser_watch.add_argument('--no_output_utilities', const=True, default=False, action='store_const', help='do not output utility functions')
+    parser_watch.add_argument('--cache_directory', type=str, default=None, help='directory to cache the extracted messages per file (e.g. .m17n_cache)')
+    parser_watch.add_argument('-j', '--jobs', type=parse_job_count, default=1, help='number of processes to extract messages in parallel on the first scan (0: number of CPUs)')
+    parser_watch.add_argument('--engine', type=str, default='tokenize', choices=['tokenize', 'ast'], help='same as the generate subcommand')
+    parser_watch.add_argument('--exclude', type=str, action='append', default=[], help='same as the generate subcommand')
+    parser_watch.add_argument('--format', type=str, default='python', choices=['python', 'compiled', 'lazy'], help='same as the generate subcommand')
+    parser_watch.add_argument('--debounce', type=float, default=0.2, help='seconds to wait for the file changes to settle before updating')
+    parser_watch.add_argument('--poll_interval', type=float, default=1.0, help='seconds between the scans when inotify is not available')
+    parser_watch.add_argument('--polling', const=True, default=False, action='store_const', help='scan the files periodically even if inotify is available')
+    parser_watch.add_argument('input_python_file_paths', type=str, nargs='+', help='input python file paths (allow files as well as directories)')
+
+    parser_serve = subpersers.add_parser('serve', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_serve.add_argument('-o', '--output_python_file_path', type=str, required=True, help='path of the output file')
+    parser_serve.add_argument('-k', '--keywords', type=str, default='_ iface_', help='space-separated list of keywords to look for in addition to the defaults (may be repeated multiple times)')
+    parser_serve.add_argument('--default_locale', type=str, default='en_US', help='default locale')
+    parser_serve.add_argument('--default_context', type=str, default='*', help='default context')
+    parser_serve.add_argument('--no_output_utilities', const=True, default=False, action='store_const', help='do not output utility functions')
+    parser_serve.add_argument('--cache_directory', type=str, default=None, help='directory to cache the extracted messages per file (e.g. .m17n_cache)')
+    parser_serve.add_argument('-j', '--jobs', type=parse_job_count, default=1, help='number of processes to extract messages in parallel on the start (0: number of CPUs)')
+    parser_serve.add_argument('--engine', type=str, default='tokenize', choices=['tokenize', 'ast'], help='same as the generate subcommand')
+    parser_serve.add_argument('--exclude', type=str, action='append', default=[], help='same as the generate subcommand')
+    parser_serve.add_argument('--format', type=str, default='python', choices=['python', 'compiled', 'lazy'], help='same as the generate subcommand')
+    parser_serve.add_argument('--socket', type=str, default=None, help='path of a Unix socket to listen on instead of stdin and stdout')
+    parser_serve.add_argument('input_python_file_paths', type=str, nargs='+', help='input python file paths (allow files as well as directories)')
+
+    parser_export_po = subpersers.add_parser('export-po', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_export_po.add_argument('-o', '--output_python_file_path', type=str, required=True, help='path of the output file of generate')
+    parser_export_po.add_argument('--po_directory', type=str, required=True, help='directory to write a PO file per locale and a POT file into')
+    parser_export_po.add_argument('--default_locale', type=str, default='en_US', help='default locale')
+    parser_export_po.add_argument('--default_context', type=str, default='*', help='default context, written without msgctxt')
+
+    parser_import_po = subpersers.add_parser('import-po', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_import_po.add_argument('-o', '--output_python_file_path', type=str, required=True, help='path of the output file')
+    parser_import_po.add_argument('--po_directory', type=str, required=True, help='directory to read the PO files from')
+    parser_import_po.add_argument('-k', '--keywords', type=str, default='_ iface_', help='space-separated list of keywords to look for in addition to the defaults (may be repeated multiple times)')
+    parser_import_po.add_argument('--default_locale', type=str, default='en_US', help='default locale')
+    parser_import_po.add_argument('--default_context', type=str, default='*', help='default context, of the entries without msgctxt')
+    parser_import_po.add_argument('--no_output_utilities', const=True, default=False, action='store_const', help='do not output utility functions')
+    parser_import_po.add_argument('--cache_directory', type=str, default=None, help='directory to cache the extracted messages per file (e.g. .m17n_cache)')
+    parser_import_po.add_argument('-j', '--jobs', type=parse_job_count, default=1, help='number of processes to extract messages in parallel (0: number of CPUs)')
+    parser_import_po.add_argument('--engine', type=str, default='tokenize', choices=['tokenize', 'ast'], help='same as the generate subcommand')
+    parser_import_po.add_argument('--exclude', type=str, action='append', default=[], help='same as the generate subcommand')
+    parser_import_po.add_argument('--format', type=str, default='python', choices=['python', 'compiled', 'lazy'], help='same as the generate subcommand')
+    parser_import_po.add_argument('input_python_file_paths', type=str, nargs='+', help='input python file paths (allow files as well as directories)')
+
+    parser_batch = subpersers.add_parser('batch', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_batch.add_argument('manifest_file_path', type=str, help='TOML or JSON manifest of the targets, see README.md')
+    parser_batch.add_argument('--cache_directory', type=str, default=None, help='directory to cache the extracted messages per file (e.g. .m17n_cache)')
+    parser_batch.add_argument('-j', '--jobs', type=parse_job_count, default=1, help='number of processes to extract messages of all targets in parallel (0: number of CPUs)')
+
     parser_analyze = subpersers.add_parser('analyze', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser_analyze.add_argument('input_python_file_paths', type=str, nargs='+', help='input python file paths (allow files as well as directories)')
     parser_analyze.add_argument('-k', '--keywords', type=str, default='_', help='space-separated list of keywords to look for in addition to the defaults (may be repeated multiple times)')
     parser_analyze.add_argument('--distance_ratio_threshold', type=float, default='0.5', help='threshold for the ratio of distance / len(msgid)')
+    parser_analyze.add_argument('--exhaustive', const=True, default=False, action='store_const', help='calculate edit distances of all pairs without the candidate index (for verification)')
+    parser_analyze.add_argument('--backend', type=str, default='python', choices=['python', 'numpy'], help='edit distance implementation, numpy falls back to python if NumPy is not installed')
+    parser_analyze_output = parser_analyze.add_mutually_exclusive_group()
+    parser_analyze_output.add_argument('--top', type=int, default=None, help='output only the specified number of the most similar pairs')
+    parser_analyze_output.add_argument('--stream', const=True, default=False, action='store_const', help='output the pairs as soon as they are calculated, without sorting by the distance')
+    parser_analyze.add_argument('--cache_directory', type=str, default=None, help='directory to cache the extracted messages per file and the similar pairs, so that only the pairs with the new msgids are calculated on the next run (e.g. .m17n_cache)')
+    parser_analyze.add_argument('-j', '--jobs', type=parse_job_count, default=1, help='number of processes to extract messages and calculate edit distances in parallel (0: number of CPUs)')
+    parser_analyze.add_argument('--engine', type=str, default='tokenize', choices=['tokenize', 'ast'], help='same as the generate subcommand')
+    parser_analyze.add_argument('--exclude', type=str, action='append', default=[], help='same as the generate subcommand')
+    parser_analyze.add_argument('--profile', const=True, default=False, action='store_const', help='print the wall time, CPU time and peak memory of each phase and the slowest files to stderr (tracing the memory slows down the run)')
+    parser_analyze.add_argument('--metrics_json', type=str, default=None, help='path to write the metrics of --profile as JSON')
 
     options = parser.parse_args(sys.argv[1:] if args is None else args)
 
+    is_profiling = options.subcommand in ('generate', 'analyze') and (options.profile or options.metrics_json)
+    if is_profiling:
+        start_metrics()
+
     if options.subcommand == 'generate':
-        generate(
-            options.input_python_file_paths,
-            options.output_python_file_path,
-            options.keywords,
-            options.default_locale,
-            options.default_context,
-            options.no_output_utilities,
-        )
+        if options.format != 'python' and not options.output_python_file_path:
+            parser_generate.error(f'--format {options.format} requires --output_python_file_path')
+
+        try:
+            generate(
+                options.input_python_file_paths,
+                options.output_python_file_path,
+                options.keywords,
+                options.default_locale,
+                options.default_context,
+                options.no_output_utilities,
+                options.cache_directory,
+                options.jobs,
+                options.format,
+                options.engine,
+                options.fuzzy_distance_ratio_threshold if options.fuzzy else None,
+                options.exclude,
+            )
+        except ValueError as ex:
+            parser_generate.error(f'{ex}')
+    elif options.subcommand == 'watch':
+        try:
+            watch(
+                options.input_python_file_paths,
+                options.output_python_file_path,
+                options.keywords,
+                options.default_locale,
+                options.default_context,
+                options.no_output_utilities,
+                options.cache_directory,
+                options.jobs,
+                options.format,
+                options.debounce,
+                options.poll_interval,
+                options.polling,
+                options.engine,
+                options.exclude,
+            )
+        except ValueError as ex:
+            parser_watch.error(f'{ex}')
+    elif options.subcommand == 'serve':
+        try:
+            serve(
+                options.input_python_file_paths,
+                options.output_python_file_path,
+                options.keywords,
+                options.default_locale,
+                options.default_context,
+                options.no_output_utilities,
+                options.cache_directory,
+                options.jobs,
+                options.format,
+                options.engine,
+                options.socket,
+                options.exclude,
+            )
+        except ValueError as ex:
+            parser_serve.error(f'{ex}')
+    elif options.subcommand == 'export-po':
+        try:
+            export_po(
+                options.output_python_file_path,
+                options.po_directory,
+                options.default_locale,
+                options.default_context,
+            )
+        except (OSError, ValueError) as ex:
+            parser_export_po.error(f'{ex}')
+    elif options.subcommand == 'import-po':
+        try:
+            import_po(
+                options.input_python_file_paths,
+                options.output_python_file_path,
+                options.po_directory,
+                options.keywords,
+                options.default_locale,
+                options.default_context,
+                options.no_output_utilities,
+                options.cache_directory,
+                options.jobs,
+                options.format,
+                options.engine,
+                options.exclude,
+            )
+        except (OSError, ValueError) as ex:
+            parser_import_po.error(f'{ex}')
+    elif options.subcommand == 'batch':
+        try:
+            targets = load_batch_targets(options.manifest_file_path)
+        except (OSError, ValueError) as ex:
+            parser_batch.error(f'{options.manifest_file_path}: {ex}')
+
+        if not batch(targets, options.cache_directory, options.jobs):
+            sys.exit(1)
     elif options.subcommand == 'analyze':
         analyze(
             options.input_python_file_paths,
             options.keywords,
             options.distance_ratio_threshold,
+            options.cache_directory,
+            options.jobs,
+            options.exhaustive,
+            options.backend,
+            options.top,
+            options.stream,
+            options.engine,
+            options.exclude,
         )
     else:
         parser.print_help()
 
+    if is_profiling:
+        stop_metrics(options.profile, options.metrics_json)
+
+
+class Metrics:
+    """Wall time, CPU time and traced memory peak of each phase, and the extraction statistics of each file."""
+
+    def __init__(self):
+        self.phases: List[Dict[str, Any]] = []
+        self.files: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def get_cpu_time() -> float:
+        # the children are the worker processes of --jobs, they are counted once they have exited
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = self.get_cpu_time()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'name': name,
+                'wall_seconds': time.perf_counter() - wall_start,
+                'cpu_seconds': self.get_cpu_time() - cpu_start,
+                'peak_bytes': tracemalloc.get_traced_memory()[1],
+            })
+
+    def add_file(self, file_path: str, token_count: int, seconds: float, ast_parse_seconds: float):
+        self.files.append({
+            'path': file_path,
+            'token_count': token_count,
+            'seconds': seconds,
+            'ast_parse_seconds': ast_parse_seconds,
+        })
+
+    def get_slowest_files(self, count: int) -> List[Dict[str, Any]]:
+        return heapq.nlargest(count, self.files, key=lambda file: file['seconds'])
+
+    def to_json(self, slowest_file_count: int) -> Dict[str, Any]:
+        return {
+            'phases': self.phases,
+            'files': self.files,
+            'slowest_files': self.get_slowest_files(slowest_file_count),
+        }
+
+    def print_report(self, slowest_file_count: int):
+        print(f'{"phase":<20} {"wall":>10} {"cpu":>10} {"peak memory":>12}', file=sys.stderr)
+        for phase in self.phases:
+            print(f'{phase["name"]:<20} {phase["wall_seconds"]:>9.3f}s {phase["cpu_seconds"]:>9.3f}s {phase["peak_bytes"] / 1024 / 1024:>10.1f}MB', file=sys.stderr)
+
+        if not self.files:
+            return
+
+        token_count = sum(file['token_count'] for file in self.files)
+        seconds = sum(file['seconds'] for file in self.files)
+        ast_parse_seconds = sum(file['ast_parse_seconds'] for file in self.files)
+        print(f'extracted {len(self.files)} files, {token_count} tokens in {seconds:.3f}s, ast.parse of the string tokens {ast_parse_seconds:.3f}s', file=sys.stderr)
+        print('slowest files:', file=sys.stderr)
+        for file in self.get_slowest_files(slowest_file_count):
+            print(f'{file["seconds"] * 1000:>9.1f}ms {file["token_count"]:>8} tokens {file["ast_parse_seconds"] * 1000:>9.1f}ms ast.parse  {file["path"]}', file=sys.stderr)
+
+
+class TimedAst:
+    """Stands in for the ast module of pygettext to measure the time of parsing the string tokens for f-strings."""
+
+    def __init__(self, ast_module: ModuleType):
+        self.ast_module = ast_module
+        self.seconds = 0.0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.ast_module, name)
+
+    def parse(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.ast_module.parse(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+# None unless --profile or --metrics_json, the phases are not measured at all then
+metrics: Union[Metrics, None] = None
+
+
+def start_metrics():
+    global metrics  # pylint: disable=global-statement
+    metrics = Metrics()
+    tracemalloc.start()
+
+
+def stop_metrics(print_report: bool, metrics_json_file_path: Union[str, None], slowest_file_count: int = 10):
+    global metrics  # pylint: disable=global-statement
+    tracemalloc.stop()
+
+    if print_report:
+        metrics.print_report(slowest_file_count)
+
+    if metrics_json_file_path:
+        with open(metrics_json_file_path, 'w', encoding='utf-8') as file:
+            json.dump(metrics.to_json(slowest_file_count), file, indent=2)
+
+    metrics = None
+
+
+def measure_phase(name: str):
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.phase(name)
+
 
-def generate(input_python_file_paths: List[str], output_python_file_path: str, keywords: str, default_locale: str, default_context: str, no_output_utilities: bool):
-    msgid_poentry = parse_potext(get_potext(input_python_file_paths, keywords))
-    locale_msgid_context_msgstr = read_translations(output_python_file_path, default_locale)
+def generate(input_python_file_paths: List[str], output_python_file_path: str, keywords: str, default_locale: str, default_context: str, no_output_utilities: bool, cache_directory: Union[str, None] = None, jobs: int = 1, output_format: str = 'python', engine: str = 'tokenize', fuzzy_distance_ratio_threshold: Union[float, None] = None, exclude_patterns: Sequence[str] = ()):
+    msgid_message = extract_messages(input_python_file_paths, keywords, cache_directory, jobs, engine, exclude_patterns)
+    if not write_output(msgid_message, output_python_file_path, default_locale, default_context, no_output_utilities, output_format, fuzzy_distance_ratio_threshold=fuzzy_distance_ratio_threshold):
+        print(f'{output_python_file_path} is up to date', file=sys.stderr)
 
+
+def write_output(msgid_message: Dict[str, Message], output_python_file_path: str, default_locale: str, default_context: str, no_output_utilities: bool, output_format: str, locales: Iterable[str] = (), fuzzy_distance_ratio_threshold: Union[float, None] = None) -> bool:
+    """Merge the messages into the translations of the output and write it, return False if nothing has changed.
+
+    The locales that are not in the output yet are added with empty translations.
+    With fuzzy_distance_ratio_threshold, the untranslated msgids take over the translations of similar msgids no longer found in the sources.
+    """
+    with measure_phase('read_translations'):
+        locale_msgid_context_msgstr, comments = read_translations_with_comments(output_python_file_path, default_locale)
+        for locale in locales:
+            locale_msgid_context_msgstr.setdefault(locale, {})
+
+    if fuzzy_distance_ratio_threshold is not None:
+        with measure_phase('fuzzy'):
+            carried_count = carry_over_fuzzy_translations(msgid_message, locale_msgid_context_msgstr, comments, default_locale, fuzzy_distance_ratio_threshold)
+        print(f'carried over the translations to {carried_count} msgids as fuzzy', file=sys.stderr)
+
+    with measure_phase('write_output'):
+        return write_translations(msgid_message, locale_msgid_context_msgstr, comments, output_python_file_path, default_locale, default_context, no_output_utilities, output_format)
+
+
+def write_translations(msgid_message: Dict[str, Message], locale_msgid_context_msgstr: Translations, comments: TranslationComments, output_python_file_path: str, default_locale: str, default_context: str, no_output_utilities: bool, output_format: str) -> bool:
     generated_lines: List[str] = []
 
-    append_header(generated_lines, no_output_utilities)
-    append_translation_dict(generated_lines, msgid_poentry, locale_msgid_context_msgstr, default_context, default_locale)
-    append_footer(generated_lines)
+    if output_format in ('compiled', 'lazy'):
+        check_loader_output(output_python_file_path, output_format)
+
+    # read before the loader module is overwritten, only the files of the format switched from are removed
+    previous_format = read_loader_format(output_python_file_path)
+
+    if output_format == 'compiled':
+        catalog_file_path = get_catalog_file_path(output_python_file_path)
+        catalog = encode_catalog(build_translation_dict(msgid_message, locale_msgid_context_msgstr, default_context, default_locale))
+        append_catalog_loader(generated_lines, os.path.basename(catalog_file_path), no_output_utilities)
+
+        is_catalog_updated = write_if_changed(catalog_file_path, catalog)
+        is_loader_updated = write_i18n_section(output_python_file_path, generated_lines)
+        is_removed = remove_format_files(output_python_file_path, previous_format, output_format)
+        return is_catalog_updated or is_loader_updated or is_removed
+
+    if output_format == 'lazy':
+        locales_directory_path = get_locales_directory_path(output_python_file_path)
+        os.makedirs(locales_directory_path, exist_ok=True)
+
+        is_updated = False
+        for locale, msgid_context_msgstr in locale_msgid_context_msgstr.items():
+            locale_lines = iter_output_lines(msgid_message, {locale: msgid_context_msgstr}, default_context, default_locale, comments, True)
+            is_updated |= write_i18n_section(get_locale_file_path(locales_directory_path, locale), locale_lines)
+
+        append_lazy_loader(generated_lines, os.path.basename(locales_directory_path), default_locale, no_output_utilities)
+        is_updated |= write_i18n_section(output_python_file_path, generated_lines)
+        is_updated |= remove_format_files(output_python_file_path, previous_format, output_format)
+        return is_updated
+
+    # the lines are generated while being written, the whole output is never in memory
+    output_lines = iter_output_lines(msgid_message, locale_msgid_context_msgstr, default_context, default_locale, comments, no_output_utilities)
+
+    if not output_python_file_path:
+        sys.stdout.writelines(f'{line}\n' for line in output_lines)
+        return True
+
+    is_updated = write_i18n_section(output_python_file_path, output_lines)
+    return remove_format_files(output_python_file_path, previous_format, output_format) or is_updated
+
+
+def find_i18n_section(text: str) -> Union[Tuple[int, int], None]:
+    """Return the (start, end) of the autogenerated section including the begin/end markers."""
+    begin = text.find(I18N_SECTION_BEGIN)
+    if begin < 0:
+        return None
+
+    end = text.find(I18N_SECTION_END, begin)
+    if end < 0:
+        return None
+
+    return begin, end + len(I18N_SECTION_END)
+
+
+WRITE_CHUNK_SIZE = 64 * 1024
 
-    with open(output_python_file_path, 'w') if output_python_file_path else sys.stdout as output_file:
-        for line in generated_lines:
-            output_file.write(line)
-            output_file.write('\n')
 
+def get_temporary_file_path(file_path: str) -> str:
+    # in the same directory, so that os.replace() does not cross the file systems
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), f'.{os.path.basename(file_path)}.{os.getpid()}.tmp')
 
-def analyze(input_python_file_paths: List[str], keywords: str, distance_ratio_threshold: float):
+
+def replace_with(temporary_file_path: str, file_path: str):
+    if os.path.exists(file_path):
+        shutil.copymode(file_path, temporary_file_path)
+    os.replace(temporary_file_path, file_path)
+
+
+def write_atomically(file_path: str, content: Union[str, bytes]):
+    temporary_file_path = get_temporary_file_path(file_path)
+    try:
+        with open(temporary_file_path, 'wb' if isinstance(content, bytes) else 'w') as file:
+            file.write(content)
+        replace_with(temporary_file_path, file_path)
+    finally:
+        if os.path.exists(temporary_file_path):
+            os.remove(temporary_file_path)
+
+
+def write_if_changed(file_path: str, data: bytes) -> bool:
+    if os.path.isfile(file_path):
+        with open(file_path, 'rb') as file:
+            if file.read() == data:
+                return False
+
+    write_atomically(file_path, data)
+    return True
+
+
+def iter_line_chunks(lines: Iterable[str], chunk_line_count: int = 1024) -> Iterator[str]:
+    """Join the lines into chunks with the newlines, hashing and writing line by line is slow."""
+    while True:
+        chunk = ''.join(f'{line}\n' for line in itertools.islice(lines, chunk_line_count))
+        if not chunk:
+            return
+        yield chunk
+
+
+class I18nSectionScanner:
+    """Split a text fed piece by piece at the autogenerated section, the same span as find_i18n_section.
+
+    The section is only hashed, and the parts before and after it are kept.
+    A marker must not be split across the pieces, the pieces are whole lines.
+    """
+
+    BEFORE = 0
+    INSIDE = 1
+    AFTER = 2
+
+    def __init__(self):
+        self.state = self.BEFORE
+        self.before: List[str] = []
+        self.after: List[str] = []
+        self.digest = hashlib.sha1()
+        self.section_digest = hashlib.sha1()
+
+    @property
+    def has_section(self) -> bool:
+        return self.state == self.AFTER
+
+    def feed(self, text: str) -> str:
+        """Return the part of the text inside the section."""
+        self.digest.update(text.encode('utf-8'))
+
+        if self.state == self.BEFORE:
+            begin = text.find(I18N_SECTION_BEGIN)
+            if begin < 0:
+                self.before.append(text)
+                return ''
+            self.before.append(text[:begin])
+            text = text[begin:]
+            self.state = self.INSIDE
+
+        if self.state == self.INSIDE:
+            end = text.find(I18N_SECTION_END)
+            if end < 0:
+                self.section_digest.update(text.encode('utf-8'))
+                return text
+            end += len(I18N_SECTION_END)
+            self.section_digest.update(text[:end].encode('utf-8'))
+            self.after.append(text[end:])
+            self.state = self.AFTER
+            return text[:end]
+
+        self.after.append(text)
+        return ''
+
+
+def write_i18n_section(output_python_file_path: str, generated_lines: Iterable[str]) -> bool:
+    """Write the autogenerated section of the generated lines into the existing file, keeping the code around it.
+
+    The lines are streamed into a temporary file while being hashed, and it replaces the file only if something has changed.
+    The whole lines are written for a new file or a file without the section.
+    Return False if the section has not changed, the file is not touched then.
+    """
+    existing: Union[I18nSectionScanner, None] = None
+    if os.path.isfile(output_python_file_path):
+        existing = I18nSectionScanner()
+        with open(output_python_file_path, 'r') as file:
+            for lines in iter(lambda: file.readlines(WRITE_CHUNK_SIZE), []):
+                existing.feed(''.join(lines))
+
+    is_section_replaced = existing is not None and existing.has_section
+    generated = I18nSectionScanner()
+
+    temporary_file_path = get_temporary_file_path(output_python_file_path)
+    try:
+        with open(temporary_file_path, 'w') as file:
+            if is_section_replaced:
+                file.writelines(existing.before)
+            for chunk in iter_line_chunks(iter(generated_lines)):
+                section_chunk = generated.feed(chunk)
+                file.write(section_chunk if is_section_replaced else chunk)
+            if is_section_replaced:
+                file.writelines(existing.after)
+
+        if is_section_replaced and generated.has_section:
+            if existing.section_digest.digest() == generated.section_digest.digest():
+                return False
+        elif existing is not None:
+            if existing.digest.digest() == generated.digest.digest():
+                return False
+            if is_section_replaced:
+                # the generated lines have no section, all of them have been kept in before
+                with open(temporary_file_path, 'w') as file:
+                    file.writelines(generated.before)
+
+        replace_with(temporary_file_path, output_python_file_path)
+        return True
+    finally:
+        if os.path.exists(temporary_file_path):
+            os.remove(temporary_file_path)
+
+
+def watch(input_python_file_paths: List[str], output_python_file_path: str, keywords: str, default_locale: str, default_context: str, no_output_utilities: bool, cache_directory: Union[str, None] = None, jobs: int = 1, output_format: str = 'python', debounce: float = 0.2, poll_interval: float = 1.0, polling: bool = False, engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()):
+    start = time.perf_counter()
+    state = WatchState(input_python_file_paths, keywords, cache_directory, engine, exclude_patterns)
+    state.update(jobs)
+    msgid_message = state.get_msgid_message()
+    is_updated = write_output(msgid_message, output_python_file_path, default_locale, default_context, no_output_utilities, output_format)
+    print(f'{output_python_file_path} is {"updated" if is_updated else "up to date"}, {len(state.file_stats)} files in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+
+    monitor = new_file_monitor(input_python_file_paths, poll_interval, polling, exclude_patterns)
+    print(f'watching {len(input_python_file_paths)} paths with {type(monitor).__name__}, press Ctrl+C to stop', file=sys.stderr)
+    try:
+        while True:
+            monitor.wait_for_changes(debounce)
+
+            start = time.perf_counter()
+            changed_file_paths = state.update()
+            if not changed_file_paths:
+                continue
+
+            previous_msgid_message, msgid_message = msgid_message, state.get_msgid_message()
+            if msgid_message == previous_msgid_message:
+                print(f'messages unchanged, {len(changed_file_paths)} files in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+                continue
+
+            is_updated = write_output(msgid_message, output_python_file_path, default_locale, default_context, no_output_utilities, output_format)
+            print(f'{output_python_file_path} is {"updated" if is_updated else "up to date"}, {len(changed_file_paths)} files in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.close()
+
+
+class WatchState:
+    """Messages of every input file kept in memory, so that only the changed files are extracted again."""
+
+    def __init__(self, input_python_file_paths: List[str], keywords: str, cache_directory: Union[str, None] = None, engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()):
+        self.input_python_file_paths = input_python_file_paths
+        self.keywords = keywords
+        self.engine = engine
+        self.exclude_patterns = exclude_patterns
+        self.cache = ExtractionCache(cache_directory, keywords) if cache_directory else None
+        self.file_stats: Dict[str, Tuple[int, int]] = {}
+        self.file_messages: Dict[str, Messages] = {}
+
+    def update(self, jobs: int = 1, forced_file_paths: Iterable[str] = ()) -> List[str]:
+        """Extract the files whose mtime or size has changed since the last update, return the changed and removed file paths.
+
+        The forced files are extracted even if their stats have not changed, e.g. when saved twice within the mtime resolution.
+        """
+        forced_file_paths = {os.path.abspath(file_path) for file_path in forced_file_paths}
+        file_stats: Dict[str, Tuple[int, int]] = {}
+        for python_file_path in iter_python_file_paths(self.input_python_file_paths, self.exclude_patterns):
+            try:
+                file_stat = os.stat(python_file_path)
+            except OSError:
+                continue
+            file_stats[python_file_path] = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        if self.cache:
+            self.cache.prune()
+
+        changed_file_paths = [
+            python_file_path
+            for python_file_path, file_stat in file_stats.items()
+            if self.file_stats.get(python_file_path) != file_stat or (forced_file_paths and os.path.abspath(python_file_path) in forced_file_paths)
+        ]
+        removed_file_paths = [python_file_path for python_file_path in self.file_stats if python_file_path not in file_stats]
+
+        for python_file_path in removed_file_paths:
+            del self.file_messages[python_file_path]
+
+        try:
+            files_messages = collect_files_messages(changed_file_paths, self.keywords, self.cache, jobs, self.engine)
+        except OSError as ex:
+            # a file has been removed while extracting, the next change will pick up the rest
+            print(f'{ex}', file=sys.stderr)
+            for python_file_path in changed_file_paths:
+                file_stats.pop(python_file_path, None)
+                self.file_messages.pop(python_file_path, None)
+            files_messages = []
+            changed_file_paths = []
+
+        self.file_messages.update(zip(changed_file_paths, files_messages))
+        self.file_stats = file_stats
+        return changed_file_paths + removed_file_paths
+
+    def get_msgid_message(self) -> Dict[str, Message]:
+        return to_msgid_message(merge_messages(self.file_messages.values()))
+
+
+class PollingFileMonitor:
+    """Wait for a fixed interval, WatchState.update() finds the changed files by their stats."""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+
+    def wait_for_changes(self, debounce: float):
+        time.sleep(max(self.poll_interval, debounce))
+
+    def close(self):
+        pass
+
+
+class InotifyFileMonitor:
+    """Wait for the changes of the python files in the watched directories with the inotify API of Linux."""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, input_python_file_paths: List[str], exclude_patterns: Sequence[str] = ()):
+        self.exclude_patterns = exclude_patterns
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.watch_directory_paths: Dict[int, str] = {}
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+        try:
+            for python_file_path in input_python_file_paths:
+                if os.path.isdir(python_file_path):
+                    self.add_watches(python_file_path)
+                else:
+                    self.add_watch(os.path.dirname(os.path.abspath(python_file_path)))
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, directory_path: str):
+        watch_descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(directory_path), self.WATCH_MASK)
+        if watch_descriptor < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory_path)
+        self.watch_directory_paths[watch_descriptor] = directory_path
+
+    def add_watches(self, directory_path: str):
+        # a directory created later is walked from itself, so only the rules inside it and the patterns without a slash apply
+        for root, _ in walk_python_files(directory_path, self.exclude_patterns):
+            self.add_watch(root)
+
+    def read_events(self) -> bool:
+        """Return True if any event is about a python file or a directory."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+
+        is_changed = False
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + self.EVENT_HEADER.size:offset + self.EVENT_HEADER.size + name_length].rstrip(b'\0')
+            offset += self.EVENT_HEADER.size + name_length
+
+            if mask & self.IN_Q_OVERFLOW:
+                is_changed = True
+            elif mask & (self.IN_DELETE_SELF | self.IN_IGNORED):
+                # the kernel has removed the watch, its descriptor may be reused for another directory
+                is_changed = True
+                self.watch_directory_paths.pop(watch_descriptor, None)
+            elif mask & self.IN_ISDIR:
+                is_changed = True
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and watch_descriptor in self.watch_directory_paths:
+                    # inotify does not watch subdirectories by itself
+                    try:
+                        self.add_watches(os.path.join(self.watch_directory_paths[watch_descriptor], os.fsdecode(name)))
+                    except OSError as ex:
+                        print(f'{ex}', file=sys.stderr)
+            elif name.endswith(b'.py'):
+                is_changed = True
+        return is_changed
+
+    def wait_for_changes(self, debounce: float):
+        while True:
+            select.select([self.fd], [], [])
+            if self.read_events():
+                break
+
+        # wait until the events settle down, e.g. an editor writes a temporary file and renames it
+        while select.select([self.fd], [], [], debounce)[0]:
+            self.read_events()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def new_file_monitor(input_python_file_paths: List[str], poll_interval: float, polling: bool, exclude_patterns: Sequence[str] = ()) -> Union[InotifyFileMonitor, PollingFileMonitor]:
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyFileMonitor(input_python_file_paths, exclude_patterns)
+        except (OSError, AttributeError) as ex:
+            print(f'inotify is not available, fall back to polling: {ex}', file=sys.stderr)
+    return PollingFileMonitor(poll_interval)
+
+
+@dataclass
+class BatchTarget:
+    name: str
+    input_python_file_paths: List[str]
+    output_python_file_path: str
+    keywords: str = '_ iface_'
+    default_locale: str = 'en_US'
+    default_context: str = '*'
+    no_output_utilities: bool = False
+    output_format: str = 'python'
+    engine: str = 'tokenize'
+    locales: List[str] = field(default_factory=list)
+    exclude_patterns: List[str] = field(default_factory=list)
+
+
+# the keys of a target in the manifest are the long option names of the generate subcommand
+BATCH_TARGET_KEYS = {
+    'name': 'name',
+    'input_python_file_paths': 'input_python_file_paths',
+    'output_python_file_path': 'output_python_file_path',
+    'keywords': 'keywords',
+    'default_locale': 'default_locale',
+    'default_context': 'default_context',
+    'no_output_utilities': 'no_output_utilities',
+    'format': 'output_format',
+    'engine': 'engine',
+    'locales': 'locales',
+    'exclude': 'exclude_patterns',
+}
+
+# a string is taken as a list of the string for the keys of the lists
+BATCH_TARGET_LIST_KEYS = ('input_python_file_paths', 'locales', 'exclude')
+BATCH_TARGET_BOOL_KEYS = ('no_output_utilities',)
+
+
+def read_manifest(manifest_file_path: str) -> Dict[str, Any]:
+    if manifest_file_path.endswith('.toml'):
+        try:
+            import tomllib  # pylint: disable=import-outside-toplevel
+        except ImportError as ex:
+            raise ValueError('a TOML manifest requires python 3.11 or later, use a JSON manifest instead') from ex
+
+        with open(manifest_file_path, 'rb') as file:
+            return tomllib.load(file)
+
+    with open(manifest_file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def load_batch_targets(manifest_file_path: str) -> List[BatchTarget]:
+    """Read the targets of a TOML or JSON manifest.
+
+    The keys at the top level other than targets are the defaults of every target.
+    The relative paths are relative to the directory of the manifest.
+    """
+    manifest = read_manifest(manifest_file_path)
+    manifest_directory = os.path.dirname(manifest_file_path)
+    if not isinstance(manifest, dict):
+        raise ValueError('the manifest is not a table')
+    if not isinstance(manifest.get('targets', []), list):
+        raise ValueError('targets is not a list')
+
+    defaults = {key: value for key, value in manifest.items() if key != 'targets'}
+    targets: List[BatchTarget] = []
+    for index, target in enumerate(manifest.get('targets', [])):
+        if not isinstance(target, dict):
+            raise ValueError(f'targets[{index}] is not a table')
+
+        values = {**defaults, **target}
+        unknown_keys = set(values) - set(BATCH_TARGET_KEYS)
+        if unknown_keys:
+            raise ValueError(f'unknown keys of targets[{index}]: {" ".join(sorted(unknown_keys))}')
+
+        for key in ('input_python_file_paths', 'output_python_file_path'):
+            if key not in values:
+                raise ValueError(f'{key} is missing in targets[{index}]')
+
+        for key, value in values.items():
+            if key in BATCH_TARGET_LIST_KEYS:
+                if isinstance(value, str):
+                    values[key] = value = [value]
+                if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                    raise ValueError(f'{key} of targets[{index}] is not a list of strings')
+            elif key in BATCH_TARGET_BOOL_KEYS:
+                if not isinstance(value, bool):
+                    raise ValueError(f'{key} of targets[{index}] is not a boolean')
+            elif not isinstance(value, str):
+                raise ValueError(f'{key} of targets[{index}] is not a string')
+
+        values['input_python_file_paths'] = [os.path.normpath(os.path.join(manifest_directory, path)) for path in values['input_python_file_paths']]
+        values['output_python_file_path'] = os.path.normpath(os.path.join(manifest_directory, values['output_python_file_path']))
+        values.setdefault('name', values['output_python_file_path'])
+
+        for path in values['input_python_file_paths']:
+            if not os.path.exists(path):
+                raise ValueError(f'input path of {values["name"]} does not exist: {path}')
+
+        target = BatchTarget(**{BATCH_TARGET_KEYS[key]: value for key, value in values.items()})
+        if target.output_format not in ('python', 'compiled', 'lazy'):
+            raise ValueError(f'unknown format of {target.name}: {target.output_format}')
+        if target.engine not in ('tokenize', 'ast'):
+            raise ValueError(f'unknown engine of {target.name}: {target.engine}')
+        targets.append(target)
+
+    if not targets:
+        raise ValueError('no targets')
+
+    return targets
+
+
+def batch(targets: List[BatchTarget], cache_directory: Union[str, None] = None, jobs: int = 1) -> bool:
+    """Generate the outputs of the targets in one process, return False if any of them has failed.
+
+    A file shared by the targets with the same keywords and engine is extracted only once.
+    """
+    start = time.perf_counter()
+    with measure_phase('discover'):
+        targets_python_file_paths = [list(iter_python_file_paths(target.input_python_file_paths, target.exclude_patterns)) for target in targets]
+
+    with measure_phase('extract'):
+        group_python_file_paths: Dict[Tuple[str, str], Dict[str, None]] = {}
+        for target, python_file_paths in zip(targets, targets_python_file_paths):
+            group_python_file_paths.setdefault((target.keywords, target.engine), {}).update(dict.fromkeys(python_file_paths))
+
+        # a cache file per keywords, shared by the engines
+        caches: Dict[str, ExtractionCache] = {}
+        if cache_directory:
+            for keywords, _ in group_python_file_paths:
+                if keywords not in caches:
+                    caches[keywords] = ExtractionCache(cache_directory, keywords)
+            for cache in caches.values():
+                cache.prune()
+
+        file_messages: Dict[Tuple[str, str, str], Messages] = {}
+        for (keywords, engine), python_file_paths in group_python_file_paths.items():
+            cache = caches.get(keywords)
+            python_file_paths = list(python_file_paths)
+            files_messages = collect_files_messages(python_file_paths, keywords, cache, jobs, engine)
+            file_messages.update(((keywords, engine, python_file_path), messages) for python_file_path, messages in zip(python_file_paths, files_messages))
+
+    file_count = sum(len(python_file_paths) for python_file_paths in targets_python_file_paths)
+    print(f'extracted {len(file_messages)} files for {len(targets)} targets, {file_count - len(file_messages)} shared, in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+
+    is_succeeded = True
+    name_width = max(len('target'), *(len(target.name) for target in targets))
+    print(f'{"target":<{name_width}} {"files":>7} {"msgids":>7} {"time":>9}', file=sys.stderr)
+    for target, python_file_paths in zip(targets, targets_python_file_paths):
+        start = time.perf_counter()
+        msgid_message = to_msgid_message(merge_messages(file_messages[(target.keywords, target.engine, python_file_path)] for python_file_path in python_file_paths))
+        try:
+            # the same as the per-locale directory of the lazy format, for every format
+            os.makedirs(os.path.dirname(os.path.abspath(target.output_python_file_path)), exist_ok=True)
+            status = 'updated' if write_output(msgid_message, target.output_python_file_path, target.default_locale, target.default_context, target.no_output_utilities, target.output_format, target.locales) else 'up to date'
+        except (OSError, ValueError) as ex:
+            status = f'failed: {ex}'
+            is_succeeded = False
+        print(f'{target.name:<{name_width}} {len(python_file_paths):>7} {len(msgid_message):>7} {time.perf_counter() - start:>8.3f}s {status}', file=sys.stderr)
+
+    return is_succeeded
+
+
+class ServeState:
+    """The messages of the files, the translations of the output and the candidate index kept between the requests of serve."""
+
+    def __init__(self, input_python_file_paths: List[str], output_python_file_path: str, keywords: str, default_locale: str, default_context: str, no_output_utilities: bool, cache_directory: Union[str, None] = None, output_format: str = 'python', engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()):
+        self.watch_state = WatchState(input_python_file_paths, keywords, cache_directory, engine, exclude_patterns)
+        self.output_python_file_path = output_python_file_path
+        self.default_locale = default_locale
+        self.default_context = default_context
+        self.no_output_utilities = no_output_utilities
+        self.output_format = output_format
+
+        self.msgid_message: Dict[str, Message] = {}
+        self.translations_signature: Union[Tuple[Tuple[str, int, int], ...], None] = None
+        self.translations: Tuple[Translations, TranslationComments] = ({}, {})
+        self.candidate_indices: Dict[float, CandidateIndex] = {}
+
+    def update(self, jobs: int = 1, forced_file_paths: Iterable[str] = ()) -> List[str]:
+        changed_file_paths = self.watch_state.update(jobs, forced_file_paths)
+        if changed_file_paths:
+            msgid_message = self.watch_state.get_msgid_message()
+            # the candidate indices refer to the msgids by their positions
+            if list(msgid_message.keys()) != list(self.msgid_message.keys()):
+                self.candidate_indices.clear()
+            self.msgid_message = msgid_message
+        return changed_file_paths
+
+    def get_translations_signature(self) -> Tuple[Tuple[str, int, int], ...]:
+        """Return the stats of the files read_translations_with_comments can read the translations from."""
+        file_paths = [self.output_python_file_path, get_catalog_file_path(self.output_python_file_path)]
+        locales_directory_path = get_locales_directory_path(self.output_python_file_path)
+        if os.path.isdir(locales_directory_path):
+            file_paths.extend(os.path.join(locales_directory_path, file_name) for file_name in sorted(os.listdir(locales_directory_path)))
+
+        signature: List[Tuple[str, int, int]] = []
+        for file_path in file_paths:
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            signature.append((file_path, file_stat.st_mtime_ns, file_stat.st_size))
+        return tuple(signature)
+
+    def get_translations(self) -> Tuple[Translations, TranslationComments]:
+        signature = self.get_translations_signature()
+        if signature != self.translations_signature:
+            self.translations = read_translations_with_comments(self.output_python_file_path, self.default_locale)
+            self.translations_signature = signature
+        return self.translations
+
+    def extract(self, file_paths: Union[List[str], None] = None) -> Dict[str, Any]:
+        """Extract the changed files and the given files even if their stats have not changed."""
+        changed_file_paths = self.update(forced_file_paths=file_paths or ())
+        return {
+            'changed_file_paths': changed_file_paths,
+            'file_count': len(self.watch_state.file_stats),
+            'msgid_count': len(self.msgid_message),
+        }
+
+    def generate(self) -> Dict[str, Any]:
+        self.update()
+        locale_msgid_context_msgstr, comments = self.get_translations()
+        is_updated = write_translations(self.msgid_message, locale_msgid_context_msgstr, comments, self.output_python_file_path, self.default_locale, self.default_context, self.no_output_utilities, self.output_format)
+        return {
+            'updated': is_updated,
+            'msgid_count': len(self.msgid_message),
+        }
+
+    def similar(self, msgid: str, distance_ratio_threshold: float = 0.5) -> List[Dict[str, Any]]:
+        """Return the msgids within the threshold of the msgid, the most similar first."""
+        self.update()
+        msgids = list(self.msgid_message.keys())
+        candidate_index = self.candidate_indices.get(distance_ratio_threshold)
+        if candidate_index is None:
+            candidate_index = self.candidate_indices[distance_ratio_threshold] = CandidateIndex(msgids, distance_ratio_threshold)
+
+        similar_pairs: List[Tuple[int, str]] = []
+        for index in candidate_index.get_query_candidates(msgid):
+            max_distance = get_max_distance(len(msgid), len(msgids[index]), distance_ratio_threshold)
+            distance = edit_distance(msgid, msgids[index], max_distance)
+            if distance <= max_distance:
+                similar_pairs.append((distance, msgids[index]))
+
+        similar_pairs.sort()
+        return [
+            {
+                'msgid': similar_msgid,
+                'distance': distance,
+                'locations': self.msgid_message[similar_msgid].locations,
+            }
+            for distance, similar_msgid in similar_pairs
+        ]
+
+
+SERVE_METHODS = {
+    'extract': ServeState.extract,
+    'generate': ServeState.generate,
+    'similar': ServeState.similar,
+}
+
+
+def handle_serve_requests(state: ServeState, reader: Iterable[str], writer: io.TextIOBase) -> bool:
+    """Answer the JSON-lines requests of the reader until it ends, return False if shutdown is requested.
+
+    A request is {"id": ..., "method": ..., "params": {...}} and the response is {"id": ..., "result": ...} or {"id": ..., "error": ...}.
+    """
+    for line in reader:
+        if not line.strip():
+            continue
+
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            method = request['method']
+            if method == 'shutdown':
+                response = {'id': request_id, 'result': None}
+            elif method in SERVE_METHODS:
+                start = time.perf_counter()
+                result = SERVE_METHODS[method](state, **request.get('params', {}))
+                response = {'id': request_id, 'result': result, 'seconds': time.perf_counter() - start}
+            else:
+                response = {'id': request_id, 'error': f'unknown method: {method}'}
+        except (AttributeError, KeyError, TypeError, ValueError, OSError) as ex:
+            # the requests are from the editor plugins, a bad request must not stop the server
+            method = None
+            response = {'id': request_id, 'error': f'{type(ex).__name__}: {ex}'}
+
+        writer.write(json.dumps(response, ensure_ascii=False) + '\n')
+        writer.flush()
+
+        if method == 'shutdown':
+            return False
+
+    return True
+
+
+def serve(input_python_file_paths: List[str], output_python_file_path: str, keywords: str, default_locale: str, default_context: str, no_output_utilities: bool, cache_directory: Union[str, None] = None, jobs: int = 1, output_format: str = 'python', engine: str = 'tokenize', socket_file_path: Union[str, None] = None, exclude_patterns: Sequence[str] = ()):
+    start = time.perf_counter()
+    state = ServeState(input_python_file_paths, output_python_file_path, keywords, default_locale, default_context, no_output_utilities, cache_directory, output_format, engine, exclude_patterns)
+    state.update(jobs)
+    print(f'extracted {len(state.watch_state.file_stats)} files in {time.perf_counter() - start:.3f}s', file=sys.stderr)
+
+    if socket_file_path is None:
+        print('serving on stdin and stdout', file=sys.stderr)
+        try:
+            handle_serve_requests(state, sys.stdin, sys.stdout)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    try:
+        socket_stat = os.lstat(socket_file_path)
+    except FileNotFoundError:
+        socket_stat = None
+    if socket_stat is not None:
+        if not stat.S_ISSOCK(socket_stat.st_mode):
+            raise ValueError(f'not a socket, refuse to replace it: {socket_file_path}')
+        # left by a server that has not exited cleanly
+        os.remove(socket_file_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server_socket:
+        server_socket.bind(socket_file_path)
+        server_socket.listen()
+        print(f'serving on {socket_file_path}', file=sys.stderr)
+        try:
+            is_serving = True
+            while is_serving:
+                # one client at a time, the state is not shared between threads
+                connection, _ = server_socket.accept()
+                with connection, connection.makefile('r', encoding='utf-8') as reader, connection.makefile('w', encoding='utf-8') as writer:
+                    try:
+                        is_serving = handle_serve_requests(state, reader, writer)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(socket_file_path)
+
+
+def analyze(input_python_file_paths: List[str], keywords: str, distance_ratio_threshold: float, cache_directory: Union[str, None] = None, jobs: int = 1, exhaustive: bool = False, backend: str = 'python', top: Union[int, None] = None, stream: bool = False, engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()):
     print('parse files...', end='', file=sys.stderr)
-    msgid_poentry = parse_potext(get_potext(input_python_file_paths, keywords))
+    msgid_message = extract_messages(input_python_file_paths, keywords, cache_directory, jobs, engine, exclude_patterns)
     print('done', file=sys.stderr)
 
-    msgids = list(msgid_poentry.keys())
+    msgids = list(msgid_message.keys())
     msgid_count = len(msgids)
-    calculate_count = int((msgid_count * (msgid_count-1))/2)
     print(f'Number of distinct messages: {msgid_count}', file=sys.stderr)
 
-    def edit_distance(s1: str, s2: str) -> int:
-        # pylint: disable=invalid-name
-
-        n = len(s1)
-        m = len(s2)
-        dp = [[0 for i in range(m + 1)] for j in range(n + 1)]
-        return min_distance(s1, s2, n, m, dp)
-
-    count = 0
-    edit_distances: Dict[Tuple[int, int], int] = {}
+    cache = AnalyzeCache(cache_directory, distance_ratio_threshold, exhaustive) if cache_directory else None
+    cached_pairs: List[SimilarPair] = []
+    start_row = 1
+    if cache:
+        msgid_hashes = [AnalyzeCache.hash_msgid(msgid) for msgid in msgids]
+        # the cached msgids come first, so that the rows of the new msgids cover all the pairs to calculate
+        order = sorted(range(msgid_count), key=lambda index: msgid_hashes[index] not in cache.msgid_hashes)
+        cached_count = sum(1 for msgid_hash in msgid_hashes if msgid_hash in cache.msgid_hashes)
+        start_row = max(1, cached_count)
+
+        # the pairs with the removed msgids are dropped
+        msgid_hash_index = {msgid_hash: index for index, msgid_hash in enumerate(msgid_hashes)}
+        for distance, left_hash, right_hash in cache.similar_pairs:
+            left_index = msgid_hash_index.get(left_hash)
+            right_index = msgid_hash_index.get(right_hash)
+            if left_index is not None and right_index is not None:
+                cached_pairs.append((distance, max(left_index, right_index), min(left_index, right_index)))
+        print(f'reuse {len(cached_pairs)} similar pairs of {cached_count} cached messages, calculate the pairs of {msgid_count - cached_count} new messages', file=sys.stderr)
+
+    analyzed_msgids = [msgids[index] for index in order] if cache else msgids
+    calculate_count = (msgid_count * (msgid_count - 1) - start_row * (start_row - 1)) // 2
+
+    jobs = get_job_count(jobs)
+    if start_row >= msgid_count:
+        similar_pairs_iterator: Iterator[Tuple[int, List[SimilarPair]]] = iter(())
+    elif jobs == 1:
+        candidate_index = None if exhaustive else CandidateIndex(analyzed_msgids, distance_ratio_threshold)
+        numpy_edit_distance = new_numpy_edit_distance(analyzed_msgids) if backend == 'numpy' else None
+        similar_pairs_iterator = iter_similar_pairs(analyzed_msgids, range(start_row, msgid_count), distance_ratio_threshold, candidate_index, numpy_edit_distance)
+    else:
+        similar_pairs_iterator = iter_similar_pairs_in_parallel(analyzed_msgids, distance_ratio_threshold, exhaustive, backend, jobs, start_row)
 
-    print('calculate edit distances...', end='', file=sys.stderr)
-    for left_index in range(1, msgid_count):
-        for right_index in range(left_index):
-            edit_distances[(left_index, right_index)] = edit_distance(msgids[left_index], msgids[right_index])
-        count += left_index
-        print(f'\rcalculate edit distances... {count}/{calculate_count}', end='', file=sys.stderr)
-    print(' done', file=sys.stderr)
+    if cache:
+        similar_pairs_iterator = itertools.chain([(0, cached_pairs)], reorder_similar_pairs(similar_pairs_iterator, order))
 
-    for (left_index, right_index), distance in sorted(edit_distances.items(), key=lambda e: e[1]):
+    def print_similar_pair(distance: int, left_index: int, right_index: int):
         left = msgids[left_index]
         right = msgids[right_index]
 
-        if distance / len(left) > distance_ratio_threshold or distance / len(right) > distance_ratio_threshold:
-            continue
-
         print(f'===== edit distance: {distance}')
-        print(msgid_poentry[left].comment)
+        print(msgid_message[left].comment)
         print(left)
         print('-----')
         print(right)
-        print(msgid_poentry[right].comment)
+        print(msgid_message[right].comment)
         print()
 
+    count = 0
+    # only the qualifying pairs are kept, and at most top of them when it is specified
+    kept_pairs: List[SimilarPair] = []
+    # all of them are cached regardless of top and stream
+    cache_pairs: List[SimilarPair] = []
+
+    print('calculate edit distances...', end='', file=sys.stderr)
+    with measure_phase('edit_distance'):
+        for pair_count, similar_pairs in similar_pairs_iterator:
+            if cache:
+                cache_pairs.extend(similar_pairs)
+            if stream:
+                for similar_pair in sorted(similar_pairs):
+                    print_similar_pair(*similar_pair)
+            elif top is None:
+                kept_pairs.extend(similar_pairs)
+            else:
+                # a max-heap by negated keys, the worst kept pair is at the top
+                for distance, left_index, right_index in similar_pairs:
+                    heapq.heappush(kept_pairs, (-distance, -left_index, -right_index))
+                    if len(kept_pairs) > top:
+                        heapq.heappop(kept_pairs)
+            count += pair_count
+            print(f'\rcalculate edit distances... {count}/{calculate_count}', end='', file=sys.stderr)
+    print(' done', file=sys.stderr)
+
+    if cache:
+        with measure_phase('save_cache'):
+            cache.save(msgid_hashes, [(distance, msgid_hashes[left_index], msgid_hashes[right_index]) for distance, left_index, right_index in cache_pairs])
 
-def min_distance(s1: str, s2: str, n: int, m: int, dp: List[List[int]]) -> int:
-    """see: https://www.geeksforgeeks.org/edit-distance-dp-5/"""
+    if top is not None:
+        kept_pairs = [(-distance, -left_index, -right_index) for distance, left_index, right_index in kept_pairs]
+
+    with measure_phase('output'):
+        for similar_pair in sorted(kept_pairs):
+            print_similar_pair(*similar_pair)
+
+
+class AnalyzeCache:
+    """The similar pairs of the previous analyze stored on disk, so that only the pairs with the new msgids are calculated again.
+
+    The msgids are stored by their hashes, and the pairs not in the cache are known not to satisfy the threshold.
+    The cache file name is derived from the tool sources, the threshold and the algorithm, so changing any of them starts over.
+    """
+
+    def __init__(self, cache_directory: str, distance_ratio_threshold: float, exhaustive: bool):
+        algorithm = 'exhaustive' if exhaustive else 'candidate_index'
+        digest = hashlib.sha1(f'{get_tool_digest()} {distance_ratio_threshold!r} {algorithm}'.encode('utf-8')).hexdigest()
+        self.cache_file_path = os.path.join(cache_directory, f'analyze_{digest[:16]}.json')
+        self.msgid_hashes: Set[str] = set()
+        self.similar_pairs: List[Tuple[int, str, str]] = []
+
+        if os.path.isfile(self.cache_file_path):
+            try:
+                with open(self.cache_file_path, 'r', encoding='utf-8') as file:
+                    entries = json.load(file)
+                self.msgid_hashes = set(entries['msgid_hashes'])
+                self.similar_pairs = [(distance, left_hash, right_hash) for distance, left_hash, right_hash in entries['similar_pairs']]
+            except (OSError, ValueError, KeyError, TypeError) as ex:
+                print(f'ignore broken cache: {self.cache_file_path}, {ex}', file=sys.stderr)
+                self.msgid_hashes = set()
+                self.similar_pairs = []
+
+    @staticmethod
+    def hash_msgid(msgid: str) -> str:
+        return hashlib.sha1(msgid.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+
+    def save(self, msgid_hashes: List[str], similar_pairs: List[Tuple[int, str, str]]):
+        os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+        temporary_file_path = f'{self.cache_file_path}.{os.getpid()}.tmp'
+        with open(temporary_file_path, 'w', encoding='utf-8') as file:
+            json.dump({'msgid_hashes': msgid_hashes, 'similar_pairs': similar_pairs}, file)
+        os.replace(temporary_file_path, self.cache_file_path)
+        self.msgid_hashes = set(msgid_hashes)
+        self.similar_pairs = similar_pairs
+
+
+def reorder_similar_pairs(similar_pairs_iterator: Iterable[Tuple[int, List[SimilarPair]]], order: List[int]) -> Iterator[Tuple[int, List[SimilarPair]]]:
+    """Map the indices of the pairs of msgids[order[i]] back to the indices of msgids, keeping left_index > right_index."""
+    for pair_count, similar_pairs in similar_pairs_iterator:
+        yield pair_count, [
+            (distance, max(order[left_index], order[right_index]), min(order[left_index], order[right_index]))
+            for distance, left_index, right_index in similar_pairs
+        ]
+
+
+def get_job_count(jobs: int) -> int:
+    if jobs == 0:
+        return os.cpu_count() or 1
+    return jobs
+
+
+def split_rows(row_count: int, shard_count: int, start_row: int = 1) -> List[range]:
+    """Split the rows start_row..row_count-1 into blocks having about the same number of pairs, since the row i has i pairs."""
+    total_pair_count = (row_count * (row_count - 1) - start_row * (start_row - 1)) // 2
+    shards: List[range] = []
+    start = start_row
+    pair_count = 0
+    for row in range(start_row, row_count):
+        pair_count += row
+        if pair_count * shard_count >= total_pair_count * (len(shards) + 1):
+            shards.append(range(start, row + 1))
+            start = row + 1
+    if start < row_count:
+        shards.append(range(start, row_count))
+    return shards
+
+
+analyze_process_context: Dict[str, Any] = {}
+
+
+def initialize_analyze_process(msgids: List[str], distance_ratio_threshold: float, exhaustive: bool, backend: str):
+    analyze_process_context['msgids'] = msgids
+    analyze_process_context['distance_ratio_threshold'] = distance_ratio_threshold
+    analyze_process_context['candidate_index'] = None if exhaustive else CandidateIndex(msgids, distance_ratio_threshold)
+    analyze_process_context['numpy_edit_distance'] = new_numpy_edit_distance(msgids) if backend == 'numpy' else None
+
+
+def calculate_similar_pairs_in_process(left_indices: range) -> Tuple[int, List[SimilarPair]]:
+    count = 0
+    similar_pairs: List[SimilarPair] = []
+    for pair_count, block_similar_pairs in iter_similar_pairs(
+        analyze_process_context['msgids'],
+        left_indices,
+        analyze_process_context['distance_ratio_threshold'],
+        analyze_process_context['candidate_index'],
+        analyze_process_context['numpy_edit_distance'],
+    ):
+        count += pair_count
+        similar_pairs.extend(block_similar_pairs)
+    return count, similar_pairs
+
+
+def iter_similar_pairs_in_parallel(msgids: List[str], distance_ratio_threshold: float, exhaustive: bool, backend: str, jobs: int, start_row: int = 1) -> Iterator[Tuple[int, List[SimilarPair]]]:
+    """Same as iter_similar_pairs over the rows from start_row, but the rows are sharded across a process pool and the blocks are yielded in the order of completion."""
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=initialize_analyze_process, initargs=(msgids, distance_ratio_threshold, exhaustive, backend)) as executor:
+        # more shards than processes, so that the processes finishing early take over the rest
+        futures = [executor.submit(calculate_similar_pairs_in_process, left_indices) for left_indices in split_rows(len(msgids), jobs * 8, start_row)]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def get_max_distance(length1: int, length2: int, distance_ratio_threshold: float) -> int:
+    """Return the largest distance d that satisfies both d / length1 <= threshold and d / length2 <= threshold."""
+    length = min(length1, length2)
+    if length == 0:
+        return -1
+
+    max_distance = int(length * distance_ratio_threshold)
+    # correct the rounding error of the multiplication, the division is what analyze compares
+    while max_distance >= 0 and max_distance / length > distance_ratio_threshold:
+        max_distance -= 1
+    while (max_distance + 1) / length <= distance_ratio_threshold:
+        max_distance += 1
+    return max_distance
+
+
+def iter_similar_pairs(msgids: List[str], left_indices: Iterable[int], distance_ratio_threshold: float, candidate_index: Union['CandidateIndex', None] = None, numpy_edit_distance: Union['NumpyEditDistance', None] = None) -> Iterator[Tuple[int, List[SimilarPair]]]:
+    """Yield (number of the pairs covered, [(distance, left_index, right_index), ...]) per processed block of rows.
+
+    A row left_index covers the pairs with all right_index < left_index, only the pairs satisfying the threshold are returned.
+    """
+    pending_count = 0
+    pending_pairs: List[Tuple[int, int]] = []
+    pending_max_distances: List[int] = []
+
+    def calculate_pending() -> List[SimilarPair]:
+        distances = numpy_edit_distance.calculate(pending_pairs, pending_max_distances)
+        return [
+            (distance, left_index, right_index)
+            for (left_index, right_index), max_distance, distance in zip(pending_pairs, pending_max_distances, distances)
+            if distance <= max_distance
+        ]
+
+    for left_index in left_indices:
+        left = msgids[left_index]
+        right_indices = range(left_index) if candidate_index is None else candidate_index.get_candidates(left_index)
+        max_distances = [get_max_distance(len(left), len(msgids[right_index]), distance_ratio_threshold) for right_index in right_indices]
+
+        if numpy_edit_distance is None:
+            similar_pairs: List[SimilarPair] = []
+            for right_index, max_distance in zip(right_indices, max_distances):
+                distance = edit_distance(left, msgids[right_index], max_distance)
+                if distance <= max_distance:
+                    similar_pairs.append((distance, left_index, right_index))
+            yield left_index, similar_pairs
+            continue
+
+        # batch the pairs over rows to amortize the overhead of the NumPy calls
+        pending_count += left_index
+        pending_pairs.extend((left_index, right_index) for right_index in right_indices)
+        pending_max_distances.extend(max_distances)
+        if len(pending_pairs) >= numpy_edit_distance.batch_size:
+            yield pending_count, calculate_pending()
+            pending_count = 0
+            pending_pairs = []
+            pending_max_distances = []
+
+    if pending_count:
+        yield pending_count, calculate_pending()
+
+
+def edit_distance(s1: str, s2: str, max_distance: Union[int, None] = None) -> int:
+    """Levenshtein distance by the bit-parallel algorithm of Myers (Hyyro's formulation).
+
+    The calculation stops as soon as the distance is known to exceed max_distance,
+    in which case max_distance + 1 is returned.
+    see: https://doi.org/10.1145/316542.316550
+    """
     # pylint: disable=invalid-name
 
-    # If any string is empty,
-    # return the remaining characters of other string
+    if s1 == s2:
+        return 0
+
+    # the longer string is the bit vector, the shorter one is iterated
+    pattern, text = (s1, s2) if len(s1) >= len(s2) else (s2, s1)
+    m = len(pattern)
+    n = len(text)
+
+    if max_distance is None:
+        max_distance = m
+
+    if m - n > max_distance:
+        return max_distance + 1
+
     if n == 0:
         return m
 
-    if m == 0:
-        return n
-
-    # To check if the recursive tree
-    # for given n & m has already been executed
-    if dp[n][m]:
-        return dp[n][m]
-
-    # If characters are equal, execute
-    # recursive function for n-1, m-1
-    if s1[n - 1] == s2[m - 1]:
-        if dp[n - 1][m - 1]:
-            dp[n][m] = dp[n - 1][m - 1]
-            return dp[n][m]
-        dp[n][m] = min_distance(s1, s2, n - 1, m - 1, dp)
-        return dp[n][m]
-
-    # If characters are nt equal, we need to
-    # find the minimum cost out of all 3 operations.
-    if dp[n - 1][m]:
-        m1 = dp[n - 1][m]
-    else:
-        m1 = min_distance(s1, s2, n - 1, m, dp)
+    peq: Dict[str, int] = {}
+    bit = 1
+    for c in pattern:
+        peq[c] = peq.get(c, 0) | bit
+        bit <<= 1
+
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv = mask
+    mv = 0
+    score = m
+    remaining = n
+    for c in text:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        # the score changes at most one per remaining character
+        remaining -= 1
+        if score - remaining > max_distance:
+            return max_distance + 1
+
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+
+    return score if score <= max_distance else max_distance + 1
+
+
+class NumpyEditDistance:
+    """Edit distances of a batch of msgid pairs at once, vectorized by NumPy.
+
+    The DP tables of all pairs are swept row by row together, the dependency inside a row
+    D[i][j] = min(T[j], D[i][j - 1] + 1) is resolved as a cumulative minimum of T[j] - j.
+    The pairs are sorted by the length of the left msgid, so the finished ones drop out of the sweep.
+    """
+
+    def __init__(self, numpy: ModuleType, msgids: List[str], batch_size: int = 4096):
+        self.numpy = numpy
+        self.batch_size = batch_size
+        self.codes = [numpy.frombuffer(msgid.encode('utf-32-le'), dtype='<i4') for msgid in msgids]
+
+    def calculate(self, pairs: List[Tuple[int, int]], max_distances: List[int]) -> List[int]:
+        """Return the edit distances, or max_distance + 1 for the pairs exceeding their max_distance."""
+        codes = self.codes
+        order = sorted(range(len(pairs)), key=lambda k: (len(codes[pairs[k][0]]), len(codes[pairs[k][1]])))
+
+        distances = [0] * len(pairs)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            batch_distances = self.calculate_batch([pairs[k] for k in batch], [max_distances[k] for k in batch])
+            for k, distance in zip(batch, batch_distances):
+                distances[k] = distance
+        return distances
+
+    def calculate_batch(self, pairs: List[Tuple[int, int]], max_distances: List[int]) -> List[int]:
+        # pylint: disable=too-many-locals
+        numpy = self.numpy
+        size = len(pairs)
+        if size == 0:
+            return []
+
+        left_lengths = numpy.array([len(self.codes[left_index]) for left_index, _ in pairs])
+        right_lengths = numpy.array([len(self.codes[right_index]) for _, right_index in pairs])
+        height = int(left_lengths[-1])
+        width = int(right_lengths.max())
+        dtype = numpy.int16 if max(height, width) < numpy.iinfo(numpy.int16).max // 2 else numpy.int32
+
+        left_codes = numpy.full((size, height), -1, dtype=numpy.int32)
+        right_codes = numpy.full((size, width), -2, dtype=numpy.int32)
+        for k, (left_index, right_index) in enumerate(pairs):
+            left_codes[k, :left_lengths[k]] = self.codes[left_index]
+            right_codes[k, :right_lengths[k]] = self.codes[right_index]
+
+        limits = numpy.array(max_distances)
+        distances = limits + 1
+
+        # the pairs [ends[i - 1]:] are still active on the row i, the pairs [ends[i - 1]:ends[i]] end on it
+        ends = numpy.searchsorted(left_lengths, numpy.arange(height + 1), side='right')
+        columns = numpy.arange(width + 1, dtype=dtype)
+        previous = numpy.tile(columns, (size, 1))
+        active = 0
+        for i in range(1, height + 1):
+            begin = int(ends[i - 1])
+            end = int(ends[i])
+            previous = previous[begin - active:]
+            active = begin
+
+            current = numpy.empty_like(previous)
+            current[:, 0] = i
+            numpy.minimum(previous[:, 1:] + 1, previous[:, :-1] + (right_codes[begin:] != left_codes[begin:, i - 1, None]), out=current[:, 1:])
+            current -= columns
+            numpy.minimum.accumulate(current, axis=1, out=current)
+            current += columns
+            previous = current
+
+            if end > begin:
+                distances[begin:end] = numpy.minimum(current[numpy.arange(end - begin), right_lengths[begin:end]], distances[begin:end])
+
+            # the minimum of a row never decreases in the following rows
+            if end == size or (current[end - begin:].min(axis=1) > limits[end:]).all():
+                break
+
+        return distances.tolist()
+
+
+def new_numpy_edit_distance(msgids: List[str]) -> Union[NumpyEditDistance, None]:
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        print('NumPy is not installed, fall back to the python backend', file=sys.stderr)
+        return None
+    return NumpyEditDistance(numpy, msgids)
+
+
+class CandidateIndex:
+    """Index of msgids to find the pairs that can satisfy the distance ratio threshold without comparing all pairs.
+
+    The candidates are narrowed by the length difference and by the q-gram lemma:
+    if ed(x, y) <= k then x and y share at least max(|x|, |y|) - q + 1 - k * q q-grams.
+    The q-grams are counted as (q-gram, occurrence) tokens, numbered from the rarest,
+    so that a candidate must share one of the first tokens of a msgid (prefix filtering).
+    """
+
+    def __init__(self, msgids: List[str], distance_ratio_threshold: float, q: Union[int, None] = None):
+        self.msgids = msgids
+        self.distance_ratio_threshold = distance_ratio_threshold
+        self.q = self.get_qgram_length(distance_ratio_threshold) if q is None else q
+
+        self.length_indices: Dict[int, List[int]] = {}
+        for index, msgid in enumerate(msgids):
+            self.length_indices.setdefault(len(msgid), []).append(index)
+        self.lengths = sorted(self.length_indices.keys())
+
+        # the tokens are numbered in the order of appearance first, not to keep the tokens of all msgids
+        appearance_ids: Dict[Tuple[str, int], int] = {}
+        token_frequencies: List[int] = []
+        msgid_appearance_ids: List[List[int]] = []
+        for msgid in msgids:
+            ids: List[int] = []
+            for token in self.get_tokens(msgid):
+                appearance_id = appearance_ids.setdefault(token, len(token_frequencies))
+                if appearance_id == len(token_frequencies):
+                    token_frequencies.append(0)
+                token_frequencies[appearance_id] += 1
+                ids.append(appearance_id)
+            msgid_appearance_ids.append(ids)
+
+        # and then from the rarest
+        token_id_of = [0] * len(token_frequencies)
+        for token_id, appearance_id in enumerate(sorted(range(len(token_frequencies)), key=token_frequencies.__getitem__)):
+            token_id_of[appearance_id] = token_id
+        self.token_id_map = {token: token_id_of[appearance_id] for token, appearance_id in appearance_ids.items()}
+
+        # tuples and arrays instead of a set per msgid, the sets took most of the memory of the index
+        self.token_ids: List[Tuple[int, ...]] = [tuple(sorted(token_id_of[appearance_id] for appearance_id in ids)) for ids in msgid_appearance_ids]
+        del msgid_appearance_ids
+        postings: List[List[int]] = [[] for _ in range(len(self.token_id_map))]
+        for index, ids in enumerate(self.token_ids):
+            for token_id in ids:
+                postings[token_id].append(index)
+        self.postings: List[array.array] = [array.array('i', indices) for indices in postings]
+
+    @staticmethod
+    def get_qgram_length(distance_ratio_threshold: float) -> int:
+        # the bound loses q tokens per edit, so a long q-gram is only useful for a low threshold
+        if distance_ratio_threshold <= 0:
+            return 3
+        return max(1, min(3, int(1 / (2 * distance_ratio_threshold))))
+
+    def get_tokens(self, msgid: str) -> List[Tuple[str, int]]:
+        qgram_counts: Dict[str, int] = {}
+        tokens: List[Tuple[str, int]] = []
+        for start in range(len(msgid) - self.q + 1):
+            qgram = msgid[start:start + self.q]
+            count = qgram_counts.get(qgram, 0) + 1
+            qgram_counts[qgram] = count
+            tokens.append((qgram, count))
+        return tokens
+
+    def get_candidates(self, left_index: int) -> List[int]:
+        """Return the indices less than left_index that can satisfy the threshold with msgids[left_index], in ascending order."""
+        return self.find_candidates(len(self.msgids[left_index]), self.token_ids[left_index], set(self.token_ids[left_index]), left_index)
+
+    def get_query_candidates(self, msgid: str) -> List[int]:
+        """Return the indices of all msgids that can satisfy the threshold with msgid, which does not have to be in the index."""
+        # the tokens not in the index are numbered after the others, they have no postings
+        unknown_token_ids = itertools.count(len(self.postings))
+        token_ids = sorted(self.token_id_map[token] if token in self.token_id_map else next(unknown_token_ids) for token in self.get_tokens(msgid))
+        return self.find_candidates(len(msgid), token_ids, set(token_ids), len(self.msgids))
+
+    def get_nearest_query_candidates(self, msgid: str) -> List[Tuple[int, int]]:
+        """Return (lower bound of the edit distance, index) of all msgids that can satisfy the threshold with msgid, the smallest bound first.
+
+        The bound is from the q-gram lemma and the length difference, so a search for the nearest msgid can stop
+        at the first bound not less than the best distance found.
+        """
+        q = self.q
+        left_length = len(msgid)
+        common_counts = collections.Counter()
+        for token in self.get_tokens(msgid):
+            token_id = self.token_id_map.get(token)
+            if token_id is not None:
+                common_counts.update(self.postings[token_id])
+
+        bound_indices: List[Tuple[int, int]] = []
+        shortest_length = int(left_length / (1 + max(0.0, self.distance_ratio_threshold))) - 1
+        for right_length in itertools.islice(self.lengths, bisect.bisect_left(self.lengths, shortest_length), None):
+            max_distance = get_max_distance(left_length, right_length, self.distance_ratio_threshold)
+            if abs(left_length - right_length) > max_distance:
+                if right_length > left_length:
+                    break
+                continue
 
-    if dp[n][m - 1]:
-        m2 = dp[n][m - 1]
-    else:
-        m2 = min_distance(s1, s2, n, m - 1, dp)
+            # max(|x|, |y|) - q + 1 - k * q <= common, that is k >= (max(|x|, |y|) - q + 1 - common) / q
+            uncommon_limit = max(left_length, right_length) - q + 1
+            min_common = uncommon_limit - max_distance * q
+            indices = self.length_indices[right_length] if min_common <= 0 else [index for index in self.length_indices[right_length] if common_counts[index] >= min_common]
+            for index in indices:
+                bound = max(abs(left_length - right_length), -(-(uncommon_limit - common_counts[index]) // q))
+                bound_indices.append((bound, index))
+
+        bound_indices.sort()
+        return bound_indices
+
+    def find_candidates(self, left_length: int, left_token_ids: Sequence[int], left_token_set: Set[int], index_limit: int) -> List[int]:
+        q = self.q
+
+        # (length, min_common_token_count) of the lengths that the length difference allows
+        length_min_commons: List[Tuple[int, int]] = []
+        shortest_length = int(left_length / (1 + max(0.0, self.distance_ratio_threshold))) - 1
+        for right_length in itertools.islice(self.lengths, bisect.bisect_left(self.lengths, shortest_length), None):
+            max_distance = get_max_distance(left_length, right_length, self.distance_ratio_threshold)
+            if abs(left_length - right_length) > max_distance:
+                if right_length > left_length:
+                    break
+                continue
+            length_min_commons.append((right_length, max(left_length, right_length) - q + 1 - max_distance * q))
+
+        if not length_min_commons:
+            return []
+
+        candidates: List[int] = []
+
+        min_common = min(min_common for _, min_common in length_min_commons)
+        if min_common <= 0:
+            # some pairs can qualify without any common token, scan the length buckets
+            for right_length, length_min_common in length_min_commons:
+                indices = self.length_indices[right_length]
+                indices = indices[:bisect.bisect_left(indices, index_limit)]
+                if length_min_common <= 0:
+                    candidates.extend(indices)
+                else:
+                    candidates.extend(i for i in indices if len(left_token_set.intersection(self.token_ids[i])) >= length_min_common)
+            candidates.sort()
+            return candidates
+
+        length_to_min_common = dict(length_min_commons)
+        seen: Set[int] = set()
+        for token_id in left_token_ids[:len(left_token_ids) - min_common + 1]:
+            if token_id >= len(self.postings):
+                break
+            for right_index in self.postings[token_id]:
+                if right_index >= index_limit:
+                    break
+                seen.add(right_index)
+
+        for right_index in seen:
+            length_min_common = length_to_min_common.get(len(self.msgids[right_index]))
+            if length_min_common is None:
+                continue
+            if len(left_token_set.intersection(self.token_ids[right_index])) >= length_min_common:
+                candidates.append(right_index)
+
+        candidates.sort()
+        return candidates
+
+
+PYTHON_STRING_ESCAPES = {
+    **{i: f'\\{i:03o}' for i in range(32)},
+    127: '\\177',
+    ord('\\'): '\\\\',
+    ord('\t'): '\\t',
+    ord('\r'): '\\r',
+    ord('\n'): '\\n',
+    ord('"'): '\\"',
+}
+
+
+def to_python_string(text: str) -> str:
+    """Quote the text as a double-quoted Python string literal, escaping like pygettext does."""
+    return f'"{text.translate(PYTHON_STRING_ESCAPES)}"'
 
-    if dp[n - 1][m - 1]:
-        m3 = dp[n - 1][m - 1]
-    else:
-        m3 = min_distance(s1, s2, n - 1, m - 1, dp)
 
-    dp[n][m] = 1 + min(m1, min(m2, m3))
-    return dp[n][m]
+def iter_locale_entries(msgid_message: Dict[str, Message], msgid_context_msgstr: Dict[str, Dict[str, str]], default_context: str, is_default_locale: bool) -> Iterator[Tuple[Union[Message, None], str, str, str]]:
+    """Yield (message, context, msgid, msgstr) of a locale in the output order.
 
+    The message is None for the msgids that are no longer found in the sources.
+    """
+    for msgid, message in msgid_message.items():
+        context_msgstr = msgid_context_msgstr.get(msgid, {})
 
-def append_translation_dict(output: List[str], msgid_poentry: Dict[str, PoEntry], locale_msgid_context_msgstr: Translations, context: str, default_locale: str):
-    output.append('translation_dict = {')
+        if len(context_msgstr) == 1:
+            target_context = list(context_msgstr.keys())[0]
+        else:
+            target_context = default_context
+
+        if not context_msgstr.get(target_context):
+            context_msgstr = {**context_msgstr, target_context: ''}
+
+        for context, msgstr in context_msgstr.items():
+            yield message, context, msgid, msgid if is_default_locale else msgstr
+
+    for msgid, context_msgstr in msgid_context_msgstr.items():
+        if msgid in msgid_message:
+            continue
+        for context, msgstr in context_msgstr.items():
+            yield None, context, msgid, msgid if is_default_locale else msgstr
+
+
+FUZZY_COMMENT = '#, fuzzy'
+FUZZY_QGRAM_LENGTH = 3
+
+
+def carry_over_fuzzy_translations(msgid_message: Dict[str, Message], locale_msgid_context_msgstr: Translations, comments: TranslationComments, default_locale: str, distance_ratio_threshold: float) -> int:
+    """Copy the translations of the msgids no longer found in the sources to the most similar untranslated msgids, marked as fuzzy.
+
+    Return the number of the msgids the translations are copied to.
+    """
+    translated_locales = [locale for locale in locale_msgid_context_msgstr if locale != default_locale]
+
+    def is_translated(locale: str, msgid: str) -> bool:
+        return any(locale_msgid_context_msgstr[locale].get(msgid, {}).values())
+
+    orphaned_msgids = list({
+        msgid: None
+        for locale in translated_locales
+        for msgid in locale_msgid_context_msgstr[locale]
+        if msgid not in msgid_message and is_translated(locale, msgid)
+    })
+    untranslated_msgids = [msgid for msgid in msgid_message if not any(is_translated(locale, msgid) for locale in translated_locales)]
+    if not orphaned_msgids or not untranslated_msgids:
+        return 0
+
+    # the longer q-grams are rarer, so fewer orphaned msgids share them with a msgid than with the q of analyze
+    candidate_index = CandidateIndex(orphaned_msgids, distance_ratio_threshold, FUZZY_QGRAM_LENGTH)
+    carried_count = 0
+    for msgid in untranslated_msgids:
+        best_distance, best_index = None, None
+        for bound, index in candidate_index.get_nearest_query_candidates(msgid):
+            max_distance = get_max_distance(len(msgid), len(orphaned_msgids[index]), distance_ratio_threshold)
+            if best_distance is not None:
+                if bound >= best_distance:
+                    break
+                # only a strictly closer one replaces the best
+                max_distance = min(max_distance, best_distance - 1)
+            if bound > max_distance:
+                continue
+            distance = edit_distance(msgid, orphaned_msgids[index], max_distance)
+            if distance <= max_distance:
+                best_distance, best_index = distance, index
+
+        if best_index is None:
+            continue
+
+        orphaned_msgid = orphaned_msgids[best_index]
+        for locale in translated_locales:
+            if not is_translated(locale, orphaned_msgid):
+                continue
+            context_msgstr = dict(locale_msgid_context_msgstr[locale][orphaned_msgid])
+            locale_msgid_context_msgstr[locale][msgid] = context_msgstr
+            key_comments = comments.setdefault(locale, {})
+            for context in context_msgstr:
+                key_comments[(context, msgid)] = [FUZZY_COMMENT, f'#| msgid {to_python_string(orphaned_msgid)}']
+        carried_count += 1
+
+    return carried_count
+
+
+def build_translation_dict(msgid_message: Dict[str, Message], locale_msgid_context_msgstr: Translations, context: str, default_locale: str) -> BpyTranslationDict:
+    return {
+        locale: {
+            (entry_context, msgid): msgstr
+            for _, entry_context, msgid, msgstr in iter_locale_entries(msgid_message, msgid_context_msgstr, context, locale == default_locale)
+        }
+        for locale, msgid_context_msgstr in locale_msgid_context_msgstr.items()
+    }
+
+
+def iter_translation_dict_lines(msgid_message: Dict[str, Message], locale_msgid_context_msgstr: Translations, context: str, default_locale: str, comments: Union[TranslationComments, None] = None) -> Iterator[str]:
+    yield 'translation_dict = {'
     for locale, msgid_context_msgstr in locale_msgid_context_msgstr.items():
-        for msgid, poentry in msgid_poentry.items():
-            context_msgstr = msgid_context_msgstr.setdefault(msgid, {})
+        key_comments = comments.get(locale, {}) if comments else {}
 
-            if len(context_msgstr) == 1:
-                target_context = list(context_msgstr.keys())[0]
-            else:
-                target_context = context
+        yield f'  {to_python_string(locale)}: {{'
+        previous_msgid = None
+        for message, entry_context, msgid, msgstr in iter_locale_entries(msgid_message, msgid_context_msgstr, context, locale == default_locale):
+            if msgid != previous_msgid:
+                yield f'    {message.comment}' if message else '    #: MISSING'
+                previous_msgid = msgid
+            yield from (f'    {comment}' for comment in key_comments.get((entry_context, msgid), ()))
+            yield f'    ({to_python_string(entry_context)}, {to_python_string(msgid)}): {to_python_string(msgstr)},'
 
-            if not context_msgstr.get(target_context):
-                context_msgstr[target_context] = poentry.message
+        yield '  },'
+    yield '}'
 
-        output.append(f'  "{locale}": {{')
-        for msgid, poentry in msgid_poentry.items():
-            output.append(f'    {poentry.comment}')
-            for context, msgstr in msgid_context_msgstr[msgid].items():
-                output.append(f'    ("{context}", "{msgid}"): "{msgstr if locale != default_locale else msgid}",')
 
-        for msgid in msgid_context_msgstr.keys() - msgid_poentry.keys():
-            output.append('    #: MISSING')
-            for context, msgstr in msgid_context_msgstr[msgid].items():
-                output.append(f'    ("{context}", "{msgid}"): "{msgstr if locale != default_locale else msgid}",')
+def append_translation_dict(output: List[str], msgid_message: Dict[str, Message], locale_msgid_context_msgstr: Translations, context: str, default_locale: str, comments: Union[TranslationComments, None] = None):
+    output.extend(iter_translation_dict_lines(msgid_message, locale_msgid_context_msgstr, context, default_locale, comments))
 
-        output.append('  },')
-    output.append('}')
 
+def iter_output_lines(msgid_message: Dict[str, Message], locale_msgid_context_msgstr: Translations, context: str, default_locale: str, comments: Union[TranslationComments, None], no_output_utilities: bool) -> Iterator[str]:
+    """Yield the lines of the output file of the python format."""
+    header_lines: List[str] = []
+    append_header(header_lines, no_output_utilities)
+    yield from header_lines
 
-def append_header(output: List[str], no_output_utilities: bool):
-    output.append('''# -*- coding: utf-8 -*-
-# This file can be automatically generated by blender_addon_m17n_tools.
-# See: https://github.com/UuuNyaa/blender_addon_m17n_tools
-# It can (should) also be put in a different, specific py file.
+    yield from iter_translation_dict_lines(msgid_message, locale_msgid_context_msgstr, context, default_locale, comments)
+
+    footer_lines: List[str] = []
+    append_footer(footer_lines)
+    yield from footer_lines
+
+
+CATALOG_MAGIC = b'M17N'
+CATALOG_VERSION = 1
+CATALOG_HEADER_FORMAT = '<4sIII'
+
+
+# the loader modules of --format compiled and lazy tell their format, the files of the other formats may be left over
+LOADER_FORMAT_NAME = 'M17N_OUTPUT_FORMAT'
+LOADER_FORMAT_PATTERN = re.compile(rf"{LOADER_FORMAT_NAME} = '(compiled|lazy)'")
+# the loader modules written before the format name are told by the paths they load
+LEGACY_LOADER_FORMATS = {'CATALOG_FILE_PATH = ': 'compiled', 'LOCALES_DIRECTORY_PATH = ': 'lazy'}
+
+
+def get_loader_format(lines: Iterable[str]) -> Union[str, None]:
+    """Return 'compiled' or 'lazy' for the lines of a loader module, None for a file with the autogenerated section or any other file."""
+    legacy_format: Union[str, None] = None
+    for line in lines:
+        if I18N_SECTION_BEGIN in line:
+            return None
+
+        match = LOADER_FORMAT_PATTERN.match(line)
+        if match:
+            return match.group(1)
+
+        for prefix, output_format in LEGACY_LOADER_FORMATS.items():
+            if line.startswith(prefix):
+                legacy_format = output_format
+    return legacy_format
+
+
+def get_generated_header_texts() -> List[str]:
+    """Return the texts before the autogenerated section of the python format, with and without the utilities."""
+    header_texts: List[str] = []
+    for no_output_utilities in (False, True):
+        header_lines: List[str] = []
+        append_header(header_lines, no_output_utilities)
+        header_text = ''.join(f'{line}\n' for line in header_lines)
+        header_texts.append(header_text[:header_text.index(I18N_SECTION_BEGIN)])
+    return header_texts
+
+
+def read_loader_format(output_python_file_path: str) -> Union[str, None]:
+    """Return the format of the loader module at output_python_file_path, None if it is not a loader module or does not exist."""
+    if not output_python_file_path or not os.path.isfile(output_python_file_path):
+        return None
+
+    with open(output_python_file_path, 'r') as file:
+        return get_loader_format(file)
+
+
+def scan_i18n_section(python_file_path: str) -> I18nSectionScanner:
+    scanner = I18nSectionScanner()
+    with open(python_file_path, 'r') as file:
+        for lines in iter(lambda: file.readlines(WRITE_CHUNK_SIZE), []):
+            scanner.feed(''.join(lines))
+    return scanner
+
+
+def is_generated_python_file(python_file_path: str) -> bool:
+    """Return True if the file has nothing but the generated header, the autogenerated section and blank lines after it."""
+    scanner = scan_i18n_section(python_file_path)
+    return scanner.has_section and ''.join(scanner.before) in get_generated_header_texts() and not ''.join(scanner.after).strip()
+
+
+def check_loader_output(output_python_file_path: str, output_format: str):
+    """Raise ValueError if the loader module would replace anything other than a loader module or a generated file of the python format.
+
+    The loader module is the whole file, so the code written around the autogenerated section would be lost.
+    """
+    if not os.path.isfile(output_python_file_path) or read_loader_format(output_python_file_path) is not None:
+        return
+
+    if is_generated_python_file(output_python_file_path):
+        return
+
+    raise ValueError(f'{output_python_file_path} has code other than the generated one, --format {output_format} would replace it with a loader module; move the autogenerated section into a file of its own first')
+
+
+def remove_format_files(output_python_file_path: str, previous_format: Union[str, None], output_format: str) -> bool:
+    """Remove the catalog or the per-locale files of previous_format if the output has been switched from it, return True if any has been removed.
+
+    previous_format is the format of the loader module before it was overwritten, the files of a format the output was never written in are not touched.
+    """
+    if previous_format is None or previous_format == output_format:
+        return False
+
+    if previous_format == 'compiled':
+        catalog_file_path = get_catalog_file_path(output_python_file_path)
+        if not os.path.isfile(catalog_file_path):
+            return False
+        os.remove(catalog_file_path)
+        print(f'removed {catalog_file_path} of --format compiled', file=sys.stderr)
+        return True
+
+    locales_directory_path = get_locales_directory_path(output_python_file_path)
+    if not os.path.isdir(locales_directory_path):
+        return False
+
+    # only the per-locale files written by the tool and their bytecode, anything else is left in the directory
+    removed_file_stems: List[str] = []
+    for file_name in sorted(os.listdir(locales_directory_path)):
+        file_path = os.path.join(locales_directory_path, file_name)
+        if file_name.endswith('.py') and os.path.isfile(file_path) and is_generated_python_file(file_path):
+            os.remove(file_path)
+            removed_file_stems.append(os.path.splitext(file_name)[0])
+
+    bytecode_directory_path = os.path.join(locales_directory_path, '__pycache__')
+    if os.path.isdir(bytecode_directory_path):
+        for file_name in os.listdir(bytecode_directory_path):
+            if file_name.endswith('.pyc') and file_name.split('.', 1)[0] in removed_file_stems:
+                os.remove(os.path.join(bytecode_directory_path, file_name))
+        with contextlib.suppress(OSError):
+            os.rmdir(bytecode_directory_path)
+
+    try:
+        os.rmdir(locales_directory_path)
+        print(f'removed {locales_directory_path} of --format lazy', file=sys.stderr)
+    except OSError:
+        print(f'removed {len(removed_file_stems)} locale files of --format lazy, {locales_directory_path} is kept for the other files', file=sys.stderr)
+    return bool(removed_file_stems)
+
+
+def get_catalog_file_path(output_python_file_path: str) -> str:
+    return f'{os.path.splitext(output_python_file_path)[0]}.catalog'
+
+
+def encode_catalog(translation_dict: BpyTranslationDict) -> bytes:
+    """Encode translation_dict into a binary catalog.
+
+    layout (little endian):
+      header: magic, version, string count, locale count
+      string bounds: (string count + 1) x uint32, the string i is text[bounds[i]:bounds[i + 1]]
+      locales: locale count x (name string index, entry count) uint32
+      entries: total entry count x (context, msgid, msgstr string index) uint32
+      text: all strings concatenated in UTF-8
+    Every string is stored once, however many locales share it.
+    """
+    string_indices: Dict[str, int] = {}
+
+    def intern(text: str) -> int:
+        index = string_indices.get(text)
+        if index is None:
+            index = string_indices[text] = len(string_indices)
+        return index
+
+    locales: List[int] = []
+    entries: List[int] = []
+    for locale, translations in translation_dict.items():
+        locales.append(intern(locale))
+        locales.append(len(translations))
+        for (context, msgid), msgstr in translations.items():
+            entries.append(intern(context))
+            entries.append(intern(msgid))
+            entries.append(intern(msgstr))
+
+    strings = list(string_indices.keys())
+    bounds = [0]
+    for text in strings:
+        bounds.append(bounds[-1] + len(text))
+
+    return b''.join((
+        struct.pack(CATALOG_HEADER_FORMAT, CATALOG_MAGIC, CATALOG_VERSION, len(strings), len(translation_dict)),
+        struct.pack(f'<{len(bounds)}I', *bounds),
+        struct.pack(f'<{len(locales)}I', *locales),
+        struct.pack(f'<{len(entries)}I', *entries),
+        ''.join(strings).encode('utf-8'),
+    ))
+
+
+def decode_catalog(data: bytes) -> BpyTranslationDict:
+    magic, version, string_count, locale_count = struct.unpack_from(CATALOG_HEADER_FORMAT, data, 0)
+    if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+        raise ValueError(f'unsupported catalog: {magic!r} version {version}')
+
+    offset = struct.calcsize(CATALOG_HEADER_FORMAT)
+    bounds = struct.unpack_from(f'<{string_count + 1}I', data, offset)
+    offset += 4 * (string_count + 1)
+    locales = struct.unpack_from(f'<{locale_count * 2}I', data, offset)
+    offset += 8 * locale_count
+    entry_count = sum(locales[1::2])
+    entries = struct.unpack_from(f'<{entry_count * 3}I', data, offset)
+    offset += 12 * entry_count
+
+    text = data[offset:].decode('utf-8')
+    strings = [text[bounds[i]:bounds[i + 1]] for i in range(string_count)]
+
+    translation_dict: BpyTranslationDict = {}
+    position = 0
+    for name_index, locale_entry_count in zip(locales[0::2], locales[1::2]):
+        indices = iter(entries[position:position + locale_entry_count * 3])
+        translation_dict[strings[name_index]] = {(strings[context], strings[msgid]): strings[msgstr] for context, msgid, msgstr in zip(indices, indices, indices)}
+        position += locale_entry_count * 3
+    return translation_dict
+
+
+def read_catalog(catalog_file_path: str) -> BpyTranslationDict:
+    with open(catalog_file_path, 'rb') as file:
+        return decode_catalog(file.read())
+
+
+def append_catalog_loader(output: List[str], catalog_file_name: str, no_output_utilities: bool):
+    output.append(OUTPUT_FILE_HEADER)
+
+    output.append('''import functools
+import os
+import struct
+
+import bpy
 ''')
 
     if not no_output_utilities:
-        output.append('''import bpy
+        output.append(OUTPUT_UTILITIES)
+
+    output.append(f'''{LOADER_FORMAT_NAME} = 'compiled'
+CATALOG_FILE_PATH = os.path.join(os.path.dirname(__file__), {to_python_string(catalog_file_name)})
+
+@functools.lru_cache(maxsize=None)
+def load_translation_dict():
+  # the binary catalog written by blender_addon_m17n_tools, see encode_catalog
+  with open(CATALOG_FILE_PATH, 'rb') as file:
+    data = file.read()
+
+  magic, version, string_count, locale_count = struct.unpack_from('{CATALOG_HEADER_FORMAT}', data, 0)
+  if magic != {CATALOG_MAGIC!r} or version != {CATALOG_VERSION}:
+    raise ValueError(f'unsupported catalog: {{CATALOG_FILE_PATH}}')
+
+  offset = struct.calcsize('{CATALOG_HEADER_FORMAT}')
+  bounds = struct.unpack_from(f'<{{string_count + 1}}I', data, offset)
+  offset += 4 * (string_count + 1)
+  locales = struct.unpack_from(f'<{{locale_count * 2}}I', data, offset)
+  offset += 8 * locale_count
+  entry_count = sum(locales[1::2])
+  entries = struct.unpack_from(f'<{{entry_count * 3}}I', data, offset)
+  offset += 12 * entry_count
+
+  text = data[offset:].decode('utf-8')
+  strings = [text[bounds[i]:bounds[i + 1]] for i in range(string_count)]
+
+  translation_dict = {{}}
+  position = 0
+  for name_index, locale_entry_count in zip(locales[0::2], locales[1::2]):
+    indices = iter(entries[position:position + locale_entry_count * 3])
+    translation_dict[strings[name_index]] = {{(strings[context], strings[msgid]): strings[msgstr] for context, msgid, msgstr in zip(indices, indices, indices)}}
+    position += locale_entry_count * 3
+  return translation_dict
+
+def register():
+  bpy.app.translations.register(__name__, load_translation_dict())
+
+def unregister():
+  bpy.app.translations.unregister(__name__)
+''')
+
+
+def get_locales_directory_path(output_python_file_path: str) -> str:
+    return f'{os.path.splitext(output_python_file_path)[0]}_locales'
+
+
+def get_locale_file_path(locales_directory_path: str, locale: str) -> str:
+    return os.path.join(locales_directory_path, f'{locale}.py')
+
+
+def read_locale_files(locales_directory_path: str) -> Tuple[BpyTranslationDict, TranslationComments]:
+    translation_dict: BpyTranslationDict = {}
+    comments: TranslationComments = {}
+    for file_name in sorted(os.listdir(locales_directory_path)):
+        file_path = os.path.join(locales_directory_path, file_name)
+        # the other python files put in the directory are not the per-locale files
+        if not file_name.endswith('.py') or not scan_i18n_section(file_path).has_section:
+            continue
+        locale_translation_dict, locale_comments = load_translation_dict(file_path)
+        translation_dict.update(locale_translation_dict)
+        comments.update(locale_comments)
+    return translation_dict, comments
+
+
+def append_lazy_loader(output: List[str], locales_directory_name: str, default_locale: str, no_output_utilities: bool):
+    output.append(OUTPUT_FILE_HEADER)
+
+    output.append('''import importlib.util
+import os
+
+import bpy
+''')
+
+    if not no_output_utilities:
+        output.append(OUTPUT_UTILITIES)
+
+    output.append(f'''{LOADER_FORMAT_NAME} = 'lazy'
+LOCALES_DIRECTORY_PATH = os.path.join(os.path.dirname(__file__), {to_python_string(locales_directory_name)})
+DEFAULT_LOCALE = {to_python_string(default_locale)}
+
+locale_translations = {{}}
+registered_locale = None
+subscription_owner = object()
+
+def load_locale(locale):
+  # each locale is a separate file written by blender_addon_m17n_tools, loaded on first use
+  if locale not in locale_translations:
+    translations = {{}}
+    file_path = os.path.join(LOCALES_DIRECTORY_PATH, f'{{locale}}.py')
+    if os.path.isfile(file_path):
+      spec = importlib.util.spec_from_file_location(f'{{__name__}}_locales_{{locale}}', file_path)
+      module = importlib.util.module_from_spec(spec)
+      spec.loader.exec_module(module)
+      translations = module.translation_dict.get(locale, {{}})
+    locale_translations[locale] = translations
+  return locale_translations[locale]
+
+def load_translation_dict(locale):
+  # Blender also looks up the language without the country and the variant, e.g. "pt" for "pt_BR"
+  translation_dict = {{}}
+  for candidate in (DEFAULT_LOCALE, locale, locale.split('@')[0], locale.split('_')[0]):
+    if candidate and candidate not in translation_dict:
+      translations = load_locale(candidate)
+      if translations:
+        translation_dict[candidate] = translations
+  return translation_dict
+
+def register_translations():
+  global registered_locale
+  registered_locale = bpy.app.translations.locale
+  bpy.app.translations.register(__name__, load_translation_dict(registered_locale))
+
+def on_language_changed():
+  if bpy.app.translations.locale == registered_locale:
+    return
+  bpy.app.translations.unregister(__name__)
+  register_translations()
+
+def register():
+  register_translations()
+  bpy.msgbus.subscribe_rna(
+    key=(bpy.types.PreferencesView, 'language'),
+    owner=subscription_owner,
+    args=(),
+    notify=on_language_changed,
+    options={{'PERSISTENT'}},
+  )
+
+def unregister():
+  bpy.msgbus.clear_by_owner(subscription_owner)
+  bpy.app.translations.unregister(__name__)
+''')
 
-def _(msgid: str) -> str:
+
+OUTPUT_FILE_HEADER = '''# -*- coding: utf-8 -*-
+# This file can be automatically generated by blender_addon_m17n_tools.
+# See: https://github.com/UuuNyaa/blender_addon_m17n_tools
+# It can (should) also be put in a different, specific py file.
+'''
+
+OUTPUT_UTILITIES = '''def _(msgid: str) -> str:
   return msgid
 
 def iface_(msgid: str) -> str:
   return bpy.app.translations.pgettext_iface(msgid)
+'''
+
+
+def append_header(output: List[str], no_output_utilities: bool):
+    output.append(OUTPUT_FILE_HEADER)
 
+    if not no_output_utilities:
+        output.append(f'''import bpy
+
+{OUTPUT_UTILITIES}
 def register():
   bpy.app.translations.register(__name__, translation_dict)
 
@@ -236,7 +2287,7 @@ def unregister():
   bpy.app.translations.unregister(__name__)
 ''')
 
-    output.append('''# ##### BEGIN AUTOGENERATED I18N SECTION #####
+    output.append(f'''{I18N_SECTION_BEGIN}
 # NOTE: You can safely move around this auto-generated block (with the begin/end markers!),
 #       and edit the translations by hand.
 #       Just carefully respect the format of the tuple!
@@ -244,7 +2295,7 @@ def unregister():
 
 
 def append_footer(output: List[str]):
-    output.append('# ##### END AUTOGENERATED I18N SECTION #####')
+    output.append(I18N_SECTION_END)
 
 
 def parse_potext(potext: str) -> Dict[str, PoEntry]:
@@ -264,90 +2315,962 @@ def parse_potext(potext: str) -> Dict[str, PoEntry]:
     return msgid_poentry
 
 
-def read_translations(python_file_name: str, default_locale: str) -> Translations:
-    BpyMessageKey = Tuple[str, str]
-    BpyTranslations = Dict[BpyMessageKey, str]
-    BpyTranslationDict = Dict[str, BpyTranslations]
+@dataclass
+class PoMessage:
+    __slots__ = ('context', 'msgid', 'msgstr', 'comments')
+
+    context: Union[str, None]
+    msgid: str
+    msgstr: str
+    comments: List[str]
+
+
+PO_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b', 'f': '\f', 'v': '\v'}
+PO_ESCAPE_PATTERN = re.compile(r'\\(?:([0-7]{1,3})|x([0-9A-Fa-f]{1,2})|(.))')
+PO_KEYWORD_PATTERN = re.compile(r'(msgctxt|msgid|msgid_plural|msgstr(?:\[(\d+)\])?)\s+(".*")\s*')
+PO_STRING_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def parse_po_string(literal: str) -> str:
+    match = PO_STRING_PATTERN.fullmatch(literal.strip())
+    if match is None:
+        raise ValueError(f'invalid string: {literal}')
+
+    def unescape(escape: re.Match) -> str:
+        octal, hexadecimal, character = escape.groups()
+        if octal is not None:
+            return chr(int(octal, 8))
+        if hexadecimal is not None:
+            return chr(int(hexadecimal, 16))
+        return PO_ESCAPES.get(character, character)
+
+    return PO_ESCAPE_PATTERN.sub(unescape, match.group(1))
+
+
+def iter_po_messages(lines: Iterable[str]) -> Iterator[PoMessage]:
+    """Parse the entries of a PO file line by line, only the current entry is kept in memory.
+
+    The header is yielded as the message of the empty msgid. The obsolete entries are skipped,
+    and the first msgstr of the plural forms is taken.
+    """
+    comments: List[str] = []
+    fields: Dict[str, List[str]] = {}
+    field_pieces: Union[List[str], None] = None
+
+    def pop_message() -> Union[PoMessage, None]:
+        nonlocal comments, fields, field_pieces
+        message = None
+        if 'msgid' in fields and 'msgstr' in fields:
+            message = PoMessage(
+                ''.join(fields['msgctxt']) if 'msgctxt' in fields else None,
+                ''.join(fields['msgid']),
+                ''.join(fields['msgstr']),
+                comments,
+            )
+        comments, fields, field_pieces = [], {}, None
+        return message
+
+    for lineno, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        try:
+            if stripped.startswith('"'):
+                if field_pieces is None:
+                    raise ValueError('a string without a keyword')
+                field_pieces.append(parse_po_string(stripped))
+                continue
+
+            if 'msgstr' in fields and (not stripped or stripped.startswith('#') or stripped.startswith(('msgctxt', 'msgid '))):
+                message = pop_message()
+                if message is not None:
+                    yield message
+
+            if not stripped:
+                continue
+
+            if stripped.startswith('#~'):
+                # an obsolete entry, the comments above it belong to it
+                comments, field_pieces = [], None
+                continue
+
+            if stripped.startswith('#'):
+                comments.append(stripped)
+                field_pieces = None
+                continue
+
+            match = PO_KEYWORD_PATTERN.fullmatch(stripped)
+            if match is None:
+                raise ValueError(f'unexpected line: {stripped}')
+            keyword, plural_index, literal = match.groups()
+            if plural_index is not None:
+                keyword = 'msgstr' if plural_index == '0' else keyword
+            field_pieces = fields.setdefault(keyword, [])
+            field_pieces.append(parse_po_string(literal))
+        except ValueError as ex:
+            raise ValueError(f'line {lineno}: {ex}') from ex
+
+    message = pop_message()
+    if message is not None:
+        yield message
+
+
+def iter_po_string_lines(keyword: str, text: str) -> Iterator[str]:
+    # a multi-line string is split after each newline, like xgettext
+    pieces = text.splitlines(keepends=True)
+    if len(pieces) <= 1:
+        yield f'{keyword} {to_python_string(text)}'
+        return
+
+    yield f'{keyword} ""'
+    for piece in pieces:
+        yield to_python_string(piece)
+
+
+def iter_po_file_lines(locale: Union[str, None], msgid_context_msgstr: Dict[str, Dict[str, str]], key_comments: Dict[BpyMessageKey, List[str]], default_context: str) -> Iterator[str]:
+    """Yield the lines of the PO file of the locale, or of the POT file without the translations if the locale is None.
+
+    The default context is written without msgctxt, and the comments of the entries are written as they are.
+    """
+    header = ''.join((
+        *([f'Language: {locale}\n'] if locale else []),
+        'MIME-Version: 1.0\n',
+        'Content-Type: text/plain; charset=UTF-8\n',
+        'Content-Transfer-Encoding: 8bit\n',
+    ))
+    yield 'msgid ""'
+    yield from iter_po_string_lines('msgstr', header)
+
+    for msgid, context_msgstr in msgid_context_msgstr.items():
+        for context, msgstr in context_msgstr.items():
+            yield ''
+            if locale:
+                yield from key_comments.get((context, msgid), ())
+            if context != default_context:
+                yield from iter_po_string_lines('msgctxt', context)
+            yield from iter_po_string_lines('msgid', msgid)
+            yield from iter_po_string_lines('msgstr', msgstr if locale else '')
+
+
+def write_lines_atomically(file_path: str, lines: Iterable[str]):
+    temporary_file_path = get_temporary_file_path(file_path)
+    try:
+        with open(temporary_file_path, 'w', encoding='utf-8') as file:
+            for chunk in iter_line_chunks(iter(lines)):
+                file.write(chunk)
+        replace_with(temporary_file_path, file_path)
+    finally:
+        if os.path.exists(temporary_file_path):
+            os.remove(temporary_file_path)
+
+
+def export_po(output_python_file_path: str, po_directory: str, default_locale: str, default_context: str):
+    """Write the translations of the output to a PO file per locale other than the default one, and a POT file of all msgids."""
+    locale_msgid_context_msgstr, comments = read_translations_with_comments(output_python_file_path, default_locale)
+    os.makedirs(po_directory, exist_ok=True)
+
+    pot_file_path = os.path.join(po_directory, f'{os.path.splitext(os.path.basename(output_python_file_path))[0]}.pot')
+    # an output without the default locale has no msgids to template
+    default_msgid_context_msgstr = locale_msgid_context_msgstr.get(default_locale, {})
+    write_lines_atomically(pot_file_path, iter_po_file_lines(None, default_msgid_context_msgstr, {}, default_context))
+    print(f'{pot_file_path}: {len(default_msgid_context_msgstr)} msgids', file=sys.stderr)
+
+    for locale, msgid_context_msgstr in locale_msgid_context_msgstr.items():
+        if locale == default_locale:
+            continue
+        po_file_path = os.path.join(po_directory, f'{locale}.po')
+        write_lines_atomically(po_file_path, iter_po_file_lines(locale, msgid_context_msgstr, comments.get(locale, {}), default_context))
+        print(f'{po_file_path}: {len(msgid_context_msgstr)} msgids', file=sys.stderr)
+
+
+def read_po_file(po_file_path: str, default_context: str) -> Tuple[str, Dict[str, Dict[str, str]], Dict[BpyMessageKey, List[str]]]:
+    """Return the locale, the translations and the comments of a PO file.
+
+    The locale is the Language of the header, or the file name without the extension.
+    The location and extracted comments are dropped, they are written by generate.
+    """
+    locale = os.path.splitext(os.path.basename(po_file_path))[0]
+    msgid_context_msgstr: Dict[str, Dict[str, str]] = {}
+    key_comments: Dict[BpyMessageKey, List[str]] = {}
+
+    with open(po_file_path, 'r', encoding='utf-8') as file:
+        try:
+            for message in iter_po_messages(file):
+                if message.msgid == '' and message.context is None:
+                    for header_line in message.msgstr.splitlines():
+                        name, _, value = header_line.partition(':')
+                        if name.strip() == 'Language' and value.strip():
+                            locale = value.strip()
+                    continue
+
+                context = default_context if message.context is None else message.context
+                msgid_context_msgstr.setdefault(message.msgid, {})[context] = message.msgstr
+                key_comments[(context, message.msgid)] = [comment for comment in message.comments if not comment.startswith(('#:', '#.'))]
+        except ValueError as ex:
+            raise ValueError(f'{po_file_path}: {ex}') from ex
+
+    return locale, msgid_context_msgstr, key_comments
+
+
+def import_po(input_python_file_paths: List[str], output_python_file_path: str, po_directory: str, keywords: str, default_locale: str, default_context: str, no_output_utilities: bool, cache_directory: Union[str, None] = None, jobs: int = 1, output_format: str = 'python', engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()):
+    """Merge the translations of the PO files into the output, and update it in the same way as generate."""
+    if not os.path.isdir(po_directory):
+        raise ValueError(f'PO directory is not found: {po_directory}')
+
+    msgid_message = extract_messages(input_python_file_paths, keywords, cache_directory, jobs, engine, exclude_patterns)
+    locale_msgid_context_msgstr, comments = read_translations_with_comments(output_python_file_path, default_locale)
+
+    for po_file_name in sorted(os.listdir(po_directory)):
+        if not po_file_name.endswith('.po'):
+            continue
+        locale, msgid_context_msgstr, key_comments = read_po_file(os.path.join(po_directory, po_file_name), default_context)
+        if locale == default_locale:
+            continue
+
+        locale_translations = locale_msgid_context_msgstr.setdefault(locale, {})
+        for msgid, context_msgstr in msgid_context_msgstr.items():
+            # an empty msgstr is untranslated as in gettext, it must not wipe the translation of the output
+            for context, msgstr in context_msgstr.items():
+                if msgstr:
+                    locale_translations.setdefault(msgid, {})[context] = msgstr
+
+        # the comments of the PO file replace the old ones, e.g. the fuzzy mark removed in a PO editor
+        locale_comments = comments.setdefault(locale, {})
+        for key, entry_comments in key_comments.items():
+            if entry_comments:
+                locale_comments[key] = entry_comments
+            else:
+                locale_comments.pop(key, None)
+        print(f'{po_file_name}: {len(msgid_context_msgstr)} msgids of {locale}', file=sys.stderr)
+
+    if not write_translations(msgid_message, locale_msgid_context_msgstr, comments, output_python_file_path, default_locale, default_context, no_output_utilities, output_format):
+        print(f'{output_python_file_path} is up to date', file=sys.stderr)
+
+
+TRANSLATION_DICT_STRING = r'"(?:[^"\\\n]|\\.)*"'
+TRANSLATION_DICT_LOCALE_PATTERN = re.compile(rf'\s*({TRANSLATION_DICT_STRING})\s*:\s*{{\s*')
+TRANSLATION_DICT_ENTRY_PATTERN = re.compile(rf'\s*\(\s*({TRANSLATION_DICT_STRING})\s*,\s*({TRANSLATION_DICT_STRING})\s*\)\s*:\s*({TRANSLATION_DICT_STRING})\s*,?\s*')
 
+
+def parse_translation_dict_string(literal: str) -> str:
+    if '\\' in literal:
+        return ast.literal_eval(literal)
+    return literal[1:-1]
+
+
+def parse_translation_dict_lines(lines: Iterable[str]) -> Union[Tuple[BpyTranslationDict, TranslationComments], None]:
+    """Parse translation_dict in the layout append_translation_dict writes, a line per entry.
+
+    The msgids and the contexts are interned, so that the locales share them.
+    Return None for any other layout.
+    """
+    # pylint: disable=too-many-branches
+
+    translation_dict: BpyTranslationDict = {}
+    comments: TranslationComments = {}
+    translations: Union[BpyTranslations, None] = None
+    key_comments: Dict[BpyMessageKey, List[str]] = {}
+    entry_comments: List[str] = []
+    state = 'module'
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        if state == 'module':
+            if stripped.startswith('#'):
+                continue
+            if stripped.replace(' ', '') != 'translation_dict={':
+                return None
+            state = 'locales'
+
+        elif state == 'locales':
+            if stripped.startswith('#'):
+                continue
+            if stripped == '}':
+                state = 'end'
+                continue
+            match = TRANSLATION_DICT_LOCALE_PATTERN.fullmatch(line)
+            if match is None:
+                return None
+            locale = parse_translation_dict_string(match.group(1))
+            translations = translation_dict.setdefault(locale, {})
+            key_comments = comments.setdefault(locale, {})
+            entry_comments = []
+            state = 'entries'
+
+        elif state == 'entries':
+            if stripped.startswith('#'):
+                if not stripped.startswith('#:'):
+                    entry_comments.append(stripped)
+                continue
+            if stripped in ('},', '}'):
+                state = 'locales'
+                continue
+            match = TRANSLATION_DICT_ENTRY_PATTERN.fullmatch(line)
+            if match is None:
+                return None
+            key = (sys.intern(parse_translation_dict_string(match.group(1))), sys.intern(parse_translation_dict_string(match.group(2))))
+            translations[key] = parse_translation_dict_string(match.group(3))
+            if entry_comments:
+                key_comments[key] = entry_comments
+                entry_comments = []
+
+        elif not stripped.startswith('#'):
+            return None
+
+    if state != 'end':
+        return None
+
+    return translation_dict, comments
+
+
+class I18nSectionLines:
+    """Iterate the lines of the autogenerated section of a file, the same span as find_i18n_section."""
+
+    def __init__(self, lines: Iterable[str]):
+        self.lines = lines
+        self.has_end = False
+
+    def __iter__(self) -> Iterator[str]:
+        lines = iter(self.lines)
+        for line in lines:
+            begin = line.find(I18N_SECTION_BEGIN)
+            if begin >= 0:
+                line = line[begin:]
+                break
+        else:
+            return
+
+        for line in itertools.chain([line], lines):
+            # the operator is cheaper than the method call on every line of the section
+            if I18N_SECTION_END in line:
+                self.has_end = True
+                yield line[:line.find(I18N_SECTION_END) + len(I18N_SECTION_END)]
+                return
+            yield line
+
+
+def load_translation_dict(python_file_name: str) -> Tuple[BpyTranslationDict, TranslationComments]:
+    """Load translation_dict from the autogenerated section without executing the file.
+
+    Only the literal of translation_dict is evaluated, so the file can import bpy or anything else.
+    The comment lines above each entry are returned per locale and key, except the location comments starting with '#:'.
+    """
+    # the generated layout is parsed line by line while reading, much faster than building the AST and without the whole text in memory
+    with open(python_file_name, 'r') as file:
+        section_lines = I18nSectionLines(file)
+        result = parse_translation_dict_lines(section_lines)
+    if result is not None and section_lines.has_end:
+        return result
+
+    with open(python_file_name, 'r') as file:
+        text = file.read()
+
+    span = find_i18n_section(text)
+    source = text[span[0]:span[1]] if span else text
+    lines = source.splitlines()
+
+    loader_format = get_loader_format(lines) if span is None else None
+    if loader_format == 'compiled':
+        catalog_file_path = get_catalog_file_path(python_file_name)
+        if not os.path.isfile(catalog_file_path):
+            raise ValueError(f'the catalog of the loader module is not found: {catalog_file_path}')
+        return read_catalog(catalog_file_path), {}
+    if loader_format == 'lazy':
+        locales_directory_path = get_locales_directory_path(python_file_name)
+        if not os.path.isdir(locales_directory_path):
+            raise ValueError(f'the locale files of the loader module are not found: {locales_directory_path}')
+        return read_locale_files(locales_directory_path)
+
+    dict_node: Union[ast.Dict, None] = None
+    for node in ast.parse(source, python_file_name).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) and node.targets[0].id == 'translation_dict':
+            dict_node = node.value
+    if not isinstance(dict_node, ast.Dict):
+        raise ValueError(f'translation_dict is not found: {python_file_name}')
+
+    translation_dict: BpyTranslationDict = ast.literal_eval(dict_node)
+
+    comments: TranslationComments = {}
+    for locale, translations_node in zip(translation_dict.keys(), dict_node.values):
+        if not isinstance(translations_node, ast.Dict):
+            continue
+
+        key_comments = comments.setdefault(locale, {})
+        previous_lineno = translations_node.lineno
+        for key_node, value_node in zip(translations_node.keys, translations_node.values):
+            entry_comments = [
+                line.strip()
+                for line in lines[previous_lineno:key_node.lineno - 1]
+                if line.lstrip().startswith('#') and not line.lstrip().startswith('#:')
+            ]
+            if entry_comments:
+                key_comments[ast.literal_eval(key_node)] = entry_comments
+            previous_lineno = value_node.end_lineno
+
+    return translation_dict, comments
+
+
+def read_translations_with_comments(python_file_name: str, default_locale: str) -> Tuple[Translations, TranslationComments]:
     translation_dict: BpyTranslationDict = {default_locale: {}}
+    comments: TranslationComments = {}
 
     if python_file_name and os.path.isfile(python_file_name):
-        def read_translation_dict(python_file_name: str) -> BpyTranslationDict:
-            with open(python_file_name, 'r') as file:
-                scope = {}
-                exec(file.read(), globals(), scope)  # pylint: disable=exec-used
-                return scope['translation_dict']
-
-        translation_dict = read_translation_dict(python_file_name)
+        translation_dict, comments = load_translation_dict(python_file_name)
 
     locale_msgid_context_msgstr: Translations = {}
-    for locale, translations in translation_dict.items():
+    # each locale is released as soon as it is converted, not to hold both forms of all locales
+    for locale in list(translation_dict.keys()):
+        translations = translation_dict.pop(locale)
         msgid_context_msgstr = locale_msgid_context_msgstr.setdefault(locale, {})
         for (context, msgid), msgstr in translations.items():
             context_msgstr = msgid_context_msgstr.setdefault(msgid, {})
             context_msgstr[context] = msgstr
 
-    return locale_msgid_context_msgstr
-
-
-def get_potext(input_python_file_paths: List[str], keywords: str):
-    def new_token_eater(keywords):
-        class TokenEaterOptions:
-            # constants
-            GNU = 1
-            SOLARIS = 2
-            # defaults
-            extractall = 0
-            escape = 0
-            keywords = []
-            outpath = ''
-            outfile = 'messages.pot'
-            writelocations = 1
-            locationstyle = GNU
-            verbose = 0
-            width = sys.maxsize
-            excludefilename = ''
-            docstrings = 0
-            nodocstrings = {}
-            toexclude = []
-
-        token_eater_options = TokenEaterOptions()
-        token_eater_options.keywords.extend(keywords.split(' '))
-
-        def load_pygettext() -> ModuleType:
-            loader = importlib.machinery.SourceFileLoader('pygettext', os.path.join(PACKAGE_PATH, 'externals', 'pygettext', 'pygettext.py'))
-            pygettext = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
-            loader.exec_module(pygettext)
-            return pygettext
-
-        pygettext = load_pygettext()
-        pygettext.make_escapes(not token_eater_options.escape)
-        token_eater = pygettext.TokenEater(token_eater_options)
-        return token_eater
-
-    def feed(token_eater, file_path):
-        with open(file_path, mode='rt') as file:
+    return locale_msgid_context_msgstr, comments
+
+
+def read_translations(python_file_name: str, default_locale: str) -> Translations:
+    return read_translations_with_comments(python_file_name, default_locale)[0]
+
+
+Messages = Dict[str, Dict[Tuple[str, int], int]]
+
+
+@functools.lru_cache(maxsize=None)
+def load_pygettext() -> ModuleType:
+    loader = importlib.machinery.SourceFileLoader('pygettext', PYGETTEXT_PATH)
+    pygettext = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(pygettext)
+    return pygettext
+
+
+def new_token_eater(pygettext: ModuleType, keywords: str):
+    class TokenEaterOptions:
+        # constants
+        GNU = 1
+        SOLARIS = 2
+        # defaults
+        extractall = 0
+        escape = 0
+        keywords = []
+        outpath = ''
+        outfile = 'messages.pot'
+        writelocations = 1
+        locationstyle = GNU
+        verbose = 0
+        width = sys.maxsize
+        excludefilename = ''
+        docstrings = 0
+        nodocstrings = {}
+        toexclude = []
+
+    token_eater_options = TokenEaterOptions()
+    token_eater_options.keywords = keywords.split(' ')
+
+    pygettext.make_escapes(not token_eater_options.escape)
+    token_eater = pygettext.TokenEater(token_eater_options)
+    return token_eater
+
+
+# files of this size or larger are searched through mmap instead of being read at once
+KEYWORD_SEARCH_MMAP_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def get_keyword_call_pattern(keywords: str) -> Pattern[bytes]:
+    """Return the pattern of a keyword followed by "(".
+
+    TokenEater extracts a message only when "(" is the next token of a keyword, so only whitespace
+    and line continuations can be in between, and a file without a match has no messages.
+    """
+    alternatives = b'|'.join(re.escape(keyword.encode('utf-8')) for keyword in keywords.split(' ') if keyword)
+    return re.compile(rb'(?<![0-9A-Za-z_])(?:' + alternatives + rb')[\s\\]*\(')
+
+
+def has_keyword_call(keywords: str, file_path: str) -> bool:
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < KEYWORD_SEARCH_MMAP_SIZE:
+            return get_keyword_call_pattern(keywords).search(file.read()) is not None
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return get_keyword_call_pattern(keywords).search(data) is not None
+
+
+def count_tokens(tokens: Iterator[tokenize.TokenInfo], token_counter: List[int]) -> Iterator[tokenize.TokenInfo]:
+    for token in tokens:
+        token_counter[0] += 1
+        yield token
+
+
+def extract_file_messages(pygettext: ModuleType, keywords: str, file_path: str, token_counter: Union[List[int], None] = None) -> Messages:
+    if not has_keyword_call(keywords, file_path):
+        return {}
+
+    token_eater = new_token_eater(pygettext, keywords)
+    with open(file_path, mode='rt') as file:
+        try:
+            token_eater.set_filename(file.name)
+            tokens = tokenize._tokenize(file.readline, encoding=None)  # pylint: disable=protected-access
+            if token_counter is not None:
+                tokens = count_tokens(tokens, token_counter)
+            for _token in tokens:
+                token_eater(*_token)
+        except tokenize.TokenError as ex:
+            print(f'{ex.args[0]}: {file.name}, line {ex.args[1][0]}, column {ex.args[1][1]}', file=sys.stderr)
+    return token_eater.get_messages()
+
+
+# a string literal that TokenEater takes as a part of a message, see is_literal_string of pygettext
+STRING_LITERAL_PATTERN = r'''[rRuU]?(?:\'\'\'(?:[^\\]|\\.)*?\'\'\'|"""(?:[^\\]|\\.)*?"""|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")'''
+STRING_LITERAL_SEPARATOR_PATTERN = r'(?:\s|#[^\n]*|\\\n)*'
+
+# the source text of a keyword call after the keyword, "(" has to be the next token of the keyword
+KEYWORD_CALL_OPEN_PATTERN = re.compile(r'(?:[ \t\f]|\\\n)*\(')
+KEYWORD_CALL_PATTERN = re.compile(
+    rf'(?:[ \t\f]|\\\n)*\({STRING_LITERAL_SEPARATOR_PATTERN}(?:{STRING_LITERAL_PATTERN}{STRING_LITERAL_SEPARATOR_PATTERN})*\)',
+    re.DOTALL,
+)
+
+# before python 3.12 an f-string is a single STRING token, TokenEater parses it to find the calls in it
+IS_FSTRING_TOKENIZED = hasattr(tokenize, 'FSTRING_START')
+
+
+def get_call_name(func: ast.expr) -> Union[str, None]:
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    return None
+
+
+def get_source_text(lines: List[str], start_lineno: int, start_col_offset: int, end_lineno: int, end_col_offset: int) -> str:
+    # the column offsets of the nodes are in bytes of UTF-8
+    if start_lineno == end_lineno:
+        return lines[start_lineno - 1].encode('utf-8')[start_col_offset:end_col_offset].decode('utf-8')
+
+    return '\n'.join([
+        lines[start_lineno - 1].encode('utf-8')[start_col_offset:].decode('utf-8'),
+        *lines[start_lineno:end_lineno - 1],
+        lines[end_lineno - 1].encode('utf-8')[:end_col_offset].decode('utf-8'),
+    ])
+
+
+def extract_file_messages_ast(keywords: str, file_path: str) -> Union[Messages, None]:
+    """Extract the same messages with the same line numbers as TokenEater by walking the syntax tree once.
+
+    Return None if the file has something TokenEater may read differently from the tree, e.g. a syntax error,
+    a keyword call with other than string literals or a class named as a keyword.
+    """
+    if not has_keyword_call(keywords, file_path):
+        return {}
+
+    with open(file_path, mode='rt') as file:
+        source = file.read()
+
+    try:
+        module = ast.parse(source, file_path)
+    except (SyntaxError, ValueError):
+        return None
+
+    keyword_set = set(keywords.split(' '))
+    lines = source.split('\n')
+    messages: Messages = {}
+
+    nodes: List[ast.AST] = [module]
+    while nodes:
+        node = nodes.pop()
+
+        if isinstance(node, ast.Call) and get_call_name(node.func) in keyword_set:
+            func = node.func
+            text = get_source_text(lines, func.end_lineno, func.end_col_offset, node.end_lineno, node.end_col_offset)
+            open_match = KEYWORD_CALL_OPEN_PATTERN.match(text)
+            if open_match:
+                if not KEYWORD_CALL_PATTERN.fullmatch(text):
+                    # TokenEater gives up on the first unexpected token and skips it
+                    return None
+                if node.args:
+                    # TokenEater records the line of "("
+                    lineno = func.end_lineno + text.count('\n', 0, open_match.end())
+                    messages.setdefault(node.args[0].value, {})[(file_path, lineno)] = 0
+
+        elif isinstance(node, ast.JoinedStr) and not IS_FSTRING_TOKENIZED:
+            calls = [
+                call
+                for value in node.values if isinstance(value, ast.FormattedValue)
+                for call in ast.walk(value) if isinstance(call, ast.Call) and get_call_name(call.func) in keyword_set
+            ]
+            if calls and node.lineno != node.end_lineno:
+                # the line of the STRING token of the call is not known in a concatenation over lines
+                return None
+            for call in calls:
+                if len(call.args) == 1 and not call.keywords and isinstance(call.args[0], ast.Constant) and isinstance(call.args[0].value, str):
+                    messages.setdefault(call.args[0].value, {})[(file_path, node.lineno)] = 0
+            continue
+
+        elif isinstance(node, ast.ClassDef) and node.name in keyword_set:
+            return None
+
+        elif hasattr(ast, 'MatchClass') and isinstance(node, ast.MatchClass) and get_call_name(node.cls) in keyword_set:
+            return None
+
+        nodes.extend(ast.iter_child_nodes(node))
+
+    return messages
+
+
+def extract_file_messages_in_process(keywords: str, file_path: str, engine: str = 'tokenize') -> Messages:
+    if engine == 'ast':
+        file_messages = extract_file_messages_ast(keywords, file_path)
+        if file_messages is not None:
+            return file_messages
+
+    return extract_file_messages(load_pygettext(), keywords, file_path)
+
+
+def profile_file_messages_in_process(keywords: str, file_path: str, engine: str = 'tokenize') -> Tuple[Messages, int, float, float]:
+    """Return the messages, the token count, the extraction time and the time of ast.parse in pygettext."""
+    pygettext = load_pygettext()
+    if not isinstance(pygettext.ast, TimedAst):
+        pygettext.ast = TimedAst(pygettext.ast)
+    pygettext.ast.seconds = 0.0
+
+    token_counter = [0]
+    start = time.perf_counter()
+    file_messages = extract_file_messages_ast(keywords, file_path) if engine == 'ast' else None
+    if file_messages is None:
+        file_messages = extract_file_messages(pygettext, keywords, file_path, token_counter)
+    return file_messages, token_counter[0], time.perf_counter() - start, pygettext.ast.seconds
+
+
+def extract_files_messages(keywords: str, file_paths: List[str], jobs: int = 1, engine: str = 'tokenize') -> List[Messages]:
+    jobs = get_job_count(jobs)
+    extract = extract_file_messages_in_process if metrics is None else profile_file_messages_in_process
+    if jobs == 1 or len(file_paths) < 2:
+        results = [extract(keywords, file_path, engine) for file_path in file_paths]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            # map() keeps the input order, so the merged result is the same as the serial one
+            results = list(executor.map(
+                extract,
+                itertools.repeat(keywords),
+                file_paths,
+                itertools.repeat(engine),
+                chunksize=max(1, len(file_paths) // (jobs * 4)),
+            ))
+
+    if metrics is None:
+        return results
+
+    files_messages: List[Messages] = []
+    for file_path, (file_messages, token_count, seconds, ast_parse_seconds) in zip(file_paths, results):
+        metrics.add_file(file_path, token_count, seconds, ast_parse_seconds)
+        files_messages.append(file_messages)
+    return files_messages
+
+
+# the directories that never have the sources to extract, .gitignore does not list them
+DEFAULT_EXCLUDE_PATTERNS = ('.git/', '.hg/', '.svn/', '__pycache__/')
+
+# read in this order in each directory, so .m17nignore can re-include what .gitignore ignores
+IGNORE_FILE_NAMES = ('.gitignore', '.m17nignore')
+
+
+@dataclass
+class IgnoreRule:
+    """A pattern of .gitignore, matched against the path relative to the walked directory from the position of prefix."""
+    __slots__ = ('prefix', 'pattern', 'is_negated', 'is_directory_only')
+
+    prefix: str
+    pattern: Pattern
+    is_negated: bool
+    is_directory_only: bool
+
+
+def translate_ignore_pattern(pattern: str) -> str:
+    """Translate a glob of .gitignore into a regular expression, * and ? do not match / but **/ and /** match any directories."""
+    regex: List[str] = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith('**/', index):
+            regex.append('(?:.*/)?')
+            index += 3
+        elif pattern.startswith('/**', index) and index + 3 == len(pattern):
+            regex.append('/.*')
+            index += 3
+        elif pattern[index] == '*':
+            # other consecutive asterisks are a regular asterisk
+            while index < len(pattern) and pattern[index] == '*':
+                index += 1
+            regex.append('[^/]*')
+        elif pattern[index] == '?':
+            regex.append('[^/]')
+            index += 1
+        elif pattern[index] == '[':
+            start = index + 2 if pattern.startswith('[!', index) else index + 1
+            # "]" right after "[" or "[!" is a member of the set
+            end = pattern.find(']', start + 1)
+            if end < 0:
+                regex.append(re.escape('['))
+                index += 1
+                continue
+            members = ''.join(member if member == '-' else re.escape(member) for member in pattern[start:end])
+            regex.append(f'[{"^" if start == index + 2 else ""}{members}]')
+            index = end + 1
+        elif pattern[index] == '\\' and index + 1 < len(pattern):
+            regex.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            regex.append(re.escape(pattern[index]))
+            index += 1
+    return ''.join(regex)
+
+
+def parse_ignore_rule(line: str, prefix: str = '') -> Union[IgnoreRule, None]:
+    """Parse a line of .gitignore in the directory of prefix, return None for a blank line or a comment."""
+    line = line.rstrip('\r\n')
+    stripped_line = line.rstrip(' ')
+    # the trailing spaces are ignored unless the last one is escaped with a backslash
+    line = stripped_line + ' ' if stripped_line.endswith('\\') and len(stripped_line) < len(line) else stripped_line
+    if not line or line.startswith('#'):
+        return None
+
+    is_negated = line.startswith('!')
+    if is_negated:
+        line = line[1:]
+
+    is_directory_only = line.endswith('/')
+    if is_directory_only:
+        line = line[:-1]
+
+    if not line:
+        return None
+
+    # a pattern with a slash at the beginning or in the middle is relative to the directory, otherwise it matches a name at any level
+    if '/' in line:
+        regex = translate_ignore_pattern(line[1:] if line.startswith('/') else line)
+    else:
+        regex = '(?:.*/)?' + translate_ignore_pattern(line)
+    return IgnoreRule(prefix, re.compile(regex, re.DOTALL), is_negated, is_directory_only)
+
+
+def parse_ignore_rules(lines: Iterable[str], prefix: str = '') -> List[IgnoreRule]:
+    return [rule for rule in (parse_ignore_rule(line, prefix) for line in lines) if rule is not None]
+
+
+def is_ignored_path(rules: Sequence[IgnoreRule], relative_path: str, is_directory: bool) -> bool:
+    """Return True if the last rule matching the path is not negated, the rules are in the ascending order of precedence."""
+    is_ignored = False
+    for rule in rules:
+        # only a negated rule can change an ignored path and vice versa
+        if rule.is_negated != is_ignored or (rule.is_directory_only and not is_directory):
+            continue
+        if rule.pattern.fullmatch(relative_path, len(rule.prefix)):
+            is_ignored = not is_ignored
+    return is_ignored
+
+
+def walk_python_files(directory_path: str, exclude_patterns: Sequence[str] = ()) -> Iterator[Tuple[str, List[str]]]:
+    """Yield each directory not ignored and the names of the python files not ignored in it, top-down in the same order as os.walk.
+
+    The rules are DEFAULT_EXCLUDE_PATTERNS, the ignore files found in the walk and then exclude_patterns relative to directory_path,
+    the later ones taking precedence as in git. An ignored directory is never listed, so nothing under it can be re-included.
+    """
+    exclude_rules = parse_ignore_rules(exclude_patterns)
+    directories: List[Tuple[str, str, List[IgnoreRule]]] = [(directory_path, '', parse_ignore_rules(DEFAULT_EXCLUDE_PATTERNS))]
+    while directories:
+        directory, prefix, file_rules = directories.pop()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = list(iterator)
+        except OSError:
+            # os.walk skips the directories it cannot list as well
+            continue
+
+        ignore_file_names = {entry.name for entry in entries if entry.name in IGNORE_FILE_NAMES and entry.is_file()}
+        for ignore_file_name in IGNORE_FILE_NAMES:
+            if ignore_file_name in ignore_file_names:
+                with open(os.path.join(directory, ignore_file_name), 'r', encoding='utf-8', errors='replace') as file:
+                    file_rules = file_rules + parse_ignore_rules(file, prefix)
+        rules = file_rules + exclude_rules
+
+        python_file_names: List[str] = []
+        subdirectories: List[Tuple[str, str, List[IgnoreRule]]] = []
+        for entry in entries:
             try:
-                token_eater.set_filename(file.name)
-                tokens = tokenize._tokenize(file.readline, encoding=None)  # pylint: disable=protected-access
-                for _token in tokens:
-                    token_eater(*_token)
-            except tokenize.TokenError as ex:
-                print(f'{ex.args[0]}: {file.name}, line {ex.args[1][0]}, column {ex.args[1][1]}', file=sys.stderr)
-
-    token_eater = new_token_eater(keywords)
+                is_directory = entry.is_dir()
+            except OSError:
+                is_directory = False
+
+            if is_directory:
+                # a symbolic link to a directory is not followed, the same as os.walk
+                if not entry.is_symlink() and not is_ignored_path(rules, prefix + entry.name, True):
+                    subdirectories.append((entry.path, f'{prefix}{entry.name}/', file_rules))
+            elif entry.name.endswith('.py') and not is_ignored_path(rules, prefix + entry.name, False):
+                python_file_names.append(entry.name)
+
+        yield directory, python_file_names
+        directories.extend(reversed(subdirectories))
+
+
+def iter_python_file_paths(input_python_file_paths: List[str], exclude_patterns: Sequence[str] = ()) -> Iterator[str]:
+    """Yield the given files as they are and the python files in the given directories except the ignored ones."""
     for python_file_path in input_python_file_paths:
         if os.path.isfile(python_file_path):
-            feed(token_eater, python_file_path)
+            yield python_file_path
             continue
 
-        for root, _, files in os.walk(python_file_path):
-            for file in files:
-                if not file.endswith('.py'):
-                    continue
-                feed(token_eater, os.path.join(root, file))
+        for root, python_file_names in walk_python_files(python_file_path, exclude_patterns):
+            for python_file_name in python_file_names:
+                yield os.path.join(root, python_file_name)
+
+
+def get_tool_digest() -> str:
+    digest = hashlib.sha1()
+    for tool_file_path in (os.path.abspath(__file__), PYGETTEXT_PATH):
+        with open(tool_file_path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Per-file extracted messages stored on disk.
+
+    Entries are keyed by file path and validated by mtime/size, falling back to the content hash.
+    The cache file name is derived from the tool sources and the keywords, so changing either starts over.
+    """
+
+    def __init__(self, cache_directory: str, keywords: str):
+        digest = hashlib.sha1(f'{get_tool_digest()} {keywords}'.encode('utf-8')).hexdigest()
+        self.cache_file_path = os.path.join(cache_directory, f'extract_{digest[:16]}.json')
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.modified = False
+
+        if os.path.isfile(self.cache_file_path):
+            try:
+                with open(self.cache_file_path, 'r', encoding='utf-8') as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError) as ex:
+                print(f'ignore broken cache: {self.cache_file_path}, {ex}', file=sys.stderr)
+
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        with open(file_path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+
+    def get(self, file_path: str) -> Union[Messages, None]:
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return None
+
+        file_stat = os.stat(file_path)
+        if entry['mtime_ns'] != file_stat.st_mtime_ns or entry['size'] != file_stat.st_size:
+            if entry['sha1'] != self._hash_file(file_path):
+                return None
+            entry['mtime_ns'] = file_stat.st_mtime_ns
+            entry['size'] = file_stat.st_size
+            self.modified = True
+
+        messages: Messages = {}
+        for msgid, lineno, isdocstring in entry['messages']:
+            messages.setdefault(msgid, {})[(file_path, lineno)] = isdocstring
+        return messages
+
+    def prune(self):
+        """Drop the entries of the files no longer found, e.g. the deleted or renamed ones.
+
+        The entries of the files outside the walk are kept, the cache directory can be shared by the runs on other directories.
+        """
+        for file_path in [file_path for file_path in self.entries if not os.path.isfile(file_path)]:
+            del self.entries[file_path]
+            self.modified = True
+
+    def put(self, file_path: str, messages: Messages):
+        file_stat = os.stat(file_path)
+        self.entries[file_path] = {
+            'mtime_ns': file_stat.st_mtime_ns,
+            'size': file_stat.st_size,
+            'sha1': self._hash_file(file_path),
+            'messages': [
+                [msgid, lineno, isdocstring]
+                for msgid, entries in messages.items()
+                for (_, lineno), isdocstring in entries.items()
+            ],
+        }
+        self.modified = True
+
+    def save(self):
+        if not self.modified:
+            return
+
+        os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+        temporary_file_path = f'{self.cache_file_path}.{os.getpid()}.tmp'
+        with open(temporary_file_path, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, ensure_ascii=False)
+        os.replace(temporary_file_path, self.cache_file_path)
+        self.modified = False
+
+
+def collect_files_messages(python_file_paths: List[str], keywords: str, cache: Union[ExtractionCache, None] = None, jobs: int = 1, engine: str = 'tokenize') -> List[Messages]:
+    files_messages: List[Union[Messages, None]] = [cache.get(python_file_path) if cache else None for python_file_path in python_file_paths]
+
+    missing_indices = [i for i, file_messages in enumerate(files_messages) if file_messages is None]
+    missing_files_messages = extract_files_messages(keywords, [python_file_paths[i] for i in missing_indices], jobs, engine)
+    for index, file_messages in zip(missing_indices, missing_files_messages):
+        files_messages[index] = file_messages
+        if cache:
+            cache.put(python_file_paths[index], file_messages)
+
+    if cache:
+        cache.save()
+
+    return files_messages
+
+
+def merge_messages(files_messages: Iterable[Messages]) -> Messages:
+    messages: Messages = {}
+    for file_messages in files_messages:
+        for msgid, entries in file_messages.items():
+            messages.setdefault(msgid, {}).update(entries)
+    return messages
+
+
+def collect_messages(input_python_file_paths: List[str], keywords: str, cache_directory: Union[str, None] = None, jobs: int = 1, engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()) -> Messages:
+    with measure_phase('discover'):
+        python_file_paths = list(iter_python_file_paths(input_python_file_paths, exclude_patterns))
+
+    with measure_phase('extract'):
+        cache = ExtractionCache(cache_directory, keywords) if cache_directory else None
+        if cache:
+            cache.prune()
+        files_messages = collect_files_messages(python_file_paths, keywords, cache, jobs, engine)
+
+    with measure_phase('merge'):
+        return merge_messages(files_messages)
+
+
+def extract_messages(input_python_file_paths: List[str], keywords: str, cache_directory: Union[str, None] = None, jobs: int = 1, engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()) -> Dict[str, Message]:
+    """Extract messages without rendering and re-parsing a POT text.
+
+    The messages are ordered in the same way as TokenEater.write, that is by locations and then by msgid.
+    """
+    return to_msgid_message(collect_messages(input_python_file_paths, keywords, cache_directory, jobs, engine, exclude_patterns))
+
+
+def to_msgid_message(messages: Messages) -> Dict[str, Message]:
+    messages = [
+        Message(msgid, sorted(entries.keys()), any(entries.values()))
+        for msgid, entries in messages.items()
+        if msgid
+    ]
+    messages.sort(key=lambda message: (message.locations, message.msgid))
+    return {message.msgid: message for message in messages}
+
+
+def get_potext(input_python_file_paths: List[str], keywords: str, cache_directory: Union[str, None] = None, jobs: int = 1, engine: str = 'tokenize', exclude_patterns: Sequence[str] = ()):
+    token_eater = new_token_eater(load_pygettext(), keywords)
+    token_eater.get_messages().update(collect_messages(input_python_file_paths, keywords, cache_directory, jobs, engine, exclude_patterns))
 
-    with io.StringIO() as po_text_io:
+    with measure_phase('render_pot'), io.StringIO() as po_text_io:
         token_eater.write(po_text_io)
         po_text = po_text_io.getvalue()
 
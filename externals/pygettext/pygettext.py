@@ -346,6 +346,13 @@ class TokenEater:
             self.__state = self.__keywordseen
             return
         if ttype == tokenize.STRING:
+            # only an f-string containing a keyword can have a call to extract,
+            # so skip parsing all the other string literals
+            prefix = tstring[:len(tstring) - len(tstring.lstrip('rRbBuUfF'))]
+            if 'f' not in prefix and 'F' not in prefix:
+                return
+            if not any(keyword in tstring for keyword in opts.keywords):
+                return
             maybe_fstring = ast.parse(tstring, mode='eval').body
             if not isinstance(maybe_fstring, ast.JoinedStr):
                 return
@@ -460,6 +467,9 @@ class TokenEater:
         self.__curfile = filename
         self.__freshmodule = 1
 
+    def get_messages(self):
+        return self.__messages
+
     def write(self, fp):
         options = self.__options
         timestamp = time.strftime('%Y-%m-%d %H:%M%z')